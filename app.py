@@ -1,18 +1,58 @@
 import streamlit as st
 import os
-import shutil
-from src.visual_processor import process_and_index_pdf
-from src.vectorstore import get_retriever
-from src.chain import get_chain
-from src.config import INPUT_DIR, ASSETS_DIR, CHROMA_DB_DIR
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-import ast
+# Only light modules here; src.chain (Gemini client) and the embedding model / Chroma
+# are loaded by warm_up_async() after the first paint (see tools/profile_startup.py)
+from src.resources import get_vectorstore, get_registry, get_job_queue, reset_collection, warm_up_async
+from src.config import INPUT_DIR, JOB_POLL_INTERVAL, ensure_data_dirs
+from src.registry import is_outdated
+from src import job_queue, tracing
+
+ensure_data_dirs()
 
 st.set_page_config(page_title="Deep Multimodal RAG (Visual Summaries)", layout="wide")
 
 st.title("Deep Multimodal RAG (Visual)")
-st.markdown("Visual Summarization with Gemini 3 Flash + pdf2image.")
+st.markdown("Visual Summarization with Gemini 3 Flash + PyMuPDF.")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_jobs():
+    """
+    Status of recent ingestion jobs, refreshed on a timer without rerunning the whole page.
+    """
+    queue = get_job_queue()
+    jobs = queue.store.jobs(limit=5)
+    # A job that just finished changes the Knowledge Base list, which lives outside this fragment
+    finished = {job["job_id"] for job in jobs if job["status"] == job_queue.DONE}
+    seen = st.session_state.setdefault("finished_jobs", finished)
+    if finished - seen:
+        st.session_state.finished_jobs = finished
+        st.rerun(scope="app")
+    if not jobs:
+        return
+    st.divider()
+    st.subheader("Ingestion Jobs")
+    for job in jobs:
+        name = os.path.basename(job["source"])
+        status = job["status"]
+        if status == job_queue.RUNNING:
+            total = job["total_pages"] or 0
+            done = min(job["pages_done"], total)
+            st.progress(done / total if total else 0.0, text=f"{name}: page {done} of {total or '?'}")
+            if job["cancel_requested"]:
+                st.caption("Cancelling...")
+            elif st.button("Cancel", key=f"cancel_{job['job_id']}"):
+                queue.cancel(job["job_id"])
+        elif status == job_queue.QUEUED:
+            st.caption(f"{name}: queued")
+            if st.button("Cancel", key=f"cancel_{job['job_id']}"):
+                queue.cancel(job["job_id"])
+        elif status == job_queue.DONE:
+            st.caption(f"{name}: done ({job['pages_indexed']} new/changed pages)")
+        else:
+            detail = f" ({job['error']})" if job["error"] else f" at page {job['pages_done']}"
+            st.caption(f"{name}: {status}{detail}")
+            if st.button("Resume", key=f"resume_{job['job_id']}"):
+                queue.resume(job["job_id"])
 
 # Sidebar for processing
 with st.sidebar:
@@ -32,43 +72,36 @@ with st.sidebar:
         st.divider()
         st.subheader("Document Processing")
         
-        status_container = st.empty()
-        
         if st.button("Process Document (Visual)"):
-            status_container.info("Starting Processing (Fast Mode)...")
-            with st.spinner("Extracting Visuals & Text (Fast Processor)..."):
-                try:
-                    # Clear existing DB to prevent stale non-visual chunks
-                    if os.path.exists(CHROMA_DB_DIR):
-                        try:
-                            shutil.rmtree(CHROMA_DB_DIR)
-                            status_container.warning("Cleared old Knowledge Base.")
-                        except OSError as e:
-                            status_container.warning(f"File Lock: Could not clear old DB (Used by other process). Appending new data instead...")
-                            # we do NOT stop here, we try to proceed.
-                    
-                    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-                    vectorstore = Chroma(
-                        collection_name="rag_collection",
-                        embedding_function=embeddings,
-                        persist_directory=CHROMA_DB_DIR
-                    )
-                    
-                    # Process and Index directly
-                    count = process_and_index_pdf(file_path, vectorstore)
-                    if count > 0:
-                        status_container.success(f"Ingestion Complete! Indexed {count} Visual Summaries.")
-                        st.balloons()
-                    else:
-                        status_container.warning("Processed PDF but no documents were indexed.")
-
-                except RuntimeError as re:
-                        status_container.error(f"System Error: {re}")
-                        st.error("Please ensure Poppler is installed or PyMuPDF fell back correctly.")
-                except Exception as e:
-                    status_container.error(f"Error: {e}")
-                    import traceback
-                    st.code(traceback.format_exc())
+            # Ingestion runs on a background worker (see src/job_queue.py); the panel below polls it
+            get_job_queue().submit(file_path)
+            st.info("Queued for processing (Fast Mode).")
+
+    render_jobs()
+
+    # Knowledge Base contents
+    st.divider()
+    st.subheader("Knowledge Base")
+    indexed_docs = get_registry().documents()
+    for entry in indexed_docs:
+        status = " - partial" if entry["partial"] else " - outdated" if is_outdated(entry) else ""
+        st.caption(f"{os.path.basename(entry['source'])} ({entry['page_count']} pages, {entry['mode']}{status})")
+    # Indexed by an older INGEST_VERSION: figure crops and other newer metadata are missing
+    outdated_docs = [e for e in indexed_docs if is_outdated(e) and e["mode"] == "fast" and os.path.exists(e["source"])]
+    if outdated_docs:
+        st.warning(f"{len(outdated_docs)} document(s) were indexed by an older version; images may be missing from answers.")
+        if st.button("Re-index outdated documents"):
+            for entry in outdated_docs:
+                get_job_queue().submit(entry["source"])
+            st.info("Queued for re-indexing (Fast Mode).")
+    ingesting = bool(get_job_queue().store.active_jobs())
+    if st.button("Clear Knowledge Base", disabled=not indexed_docs or ingesting):
+        try:
+            reset_collection()
+            st.success("Cleared Knowledge Base.")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Could not clear Knowledge Base: {e}")
 
 # Chat Interface
 if "messages" not in st.session_state:
@@ -82,45 +115,46 @@ for message in st.session_state.messages:
                 if os.path.exists(img):
                     st.image(img, caption="Retrieved Reference", width=400)
 
+warm_up_async()
+
 if prompt := st.chat_input("Ask a question about the document"):
+    from src.chain import get_image_paths, retrieve_context, stream_answer
+
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("Analyzing text and images..."):
-            try:
-                # Initialize Chain
-                chain = get_chain()
-                
-                # Retrieve context just for UI display
-                retriever = get_retriever()
-                docs = retriever.invoke(prompt)
-
-                relevant_images = []
-
-                # Debugging Section
-                with st.expander("Debug: Multi-Vector Metadata"):
+        try:
+            # One trace per question: per-stage timings for the debug expander (see src/tracing.py)
+            with tracing.trace("question") as question_trace:
+                # Retrieval first (single pass), so linked images show before generation starts
+                with st.spinner("Retrieving text and images..."):
+                    result = retrieve_context(prompt)
+                docs = result.context
+                relevant_images = result.image_paths
+
+                # Debugging Section (timings are added once the answer is done)
+                debug_expander = st.expander("Debug: Multi-Vector Metadata")
+                with debug_expander:
                     st.write(f"Retrieved {len(docs)} text chunks")
+                    plan = result.plan
+                    if plan is not None:
+                        st.write(f"Prompt plan: {len(plan.snippets)} snippets ({plan.trimmed} trimmed), "
+                                 f"{len(plan.images)} images, ~{plan.tokens} tokens")
+                        for item in plan.dropped:
+                            st.write(f"Dropped: {item}")
                     if len(docs) == 0:
                          st.warning("No documents retrieved. Check if Ingestion succeeded.")
                          # Check collection count
                          try:
-                             from src.config import CHROMA_DB_DIR
-                             from langchain_chroma import Chroma
-                             from langchain_huggingface import HuggingFaceEmbeddings
-                             embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-                             vs = Chroma(collection_name="rag_collection", embedding_function=embeddings, persist_directory=CHROMA_DB_DIR)
-                             st.write(f"Total Docs in DB: {vs._collection.count()}")
+                             st.write(f"Total Docs in DB: {get_vectorstore()._collection.count()}")
                          except:
                              pass
 
                     for i, d in enumerate(docs):
                         st.write(f"Doc {i} Metadata: {d.metadata}")
-                        # visual_processor saves 'image_path' as string, not list
-                        path = d.metadata.get("image_path")
-                        if path:
-                            relevant_images.append(path)
+                        for path in get_image_paths(d):
                             with st.container():
                                 st.write(f"**Linked Image**: {path}")
                                 if os.path.exists(path):
@@ -128,24 +162,35 @@ if prompt := st.chat_input("Ask a question about the document"):
                                 else:
                                     st.error(f"Image Missing: {path}")
 
-                # Invoke Chain
-                response_text = chain.invoke(prompt)
-                st.markdown(response_text)
-                
-                # Save history
-
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": response_text,
-                    "images": relevant_images
-                })
-            except Exception as e:
-                import traceback
-                error_msg = str(e)
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    st.error("⚠️ **Google AI Rate Limit Hit (Free Tier)**")
-                    st.warning("The system is sending too many requests too quickly for the free API plan.")
-                    st.warning("Please wait 30-60 seconds and try again.")
-                else:
-                    st.error(f"Error during generation: {e}")
-                    st.code(traceback.format_exc())
+                # Stream the answer token by token
+                response_text = st.write_stream(stream_answer(prompt, result))
+                if result.cached:
+                    st.caption("Served from answer cache.")
+
+            if question_trace.seconds is not None:  # None when RAG_TRACING=0
+                with debug_expander:
+                    st.write(f"Timing: {question_trace.seconds * 1000:.0f} ms total")
+                    for name, seconds, calls, depth in question_trace.breakdown():
+                        indent = "    " * depth
+                        suffix = f" ({calls} calls)" if calls > 1 else ""
+                        st.text(f"{indent}{name}: {seconds * 1000:.1f} ms{suffix}")
+                    for name, value in question_trace.counters.items():
+                        st.text(f"{name}: {value}")
+
+            # Save history
+
+            st.session_state.messages.append({
+                "role": "assistant", 
+                "content": response_text,
+                "images": relevant_images
+            })
+        except Exception as e:
+            import traceback
+            error_msg = str(e)
+            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+                st.error("⚠️ **Google AI Rate Limit Hit (Free Tier)**")
+                st.warning("The system is sending too many requests too quickly for the free API plan.")
+                st.warning("Please wait 30-60 seconds and try again.")
+            else:
+                st.error(f"Error during generation: {e}")
+                st.code(traceback.format_exc())
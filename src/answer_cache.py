@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from src.config import ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY
+
+
+def context_key(doc_keys):
+    """
+    Order-insensitive key for the set of retrieved documents.
+    """
+    return hashlib.sha1("\0".join(sorted(doc_keys)).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers (SQLite).
+
+    A hit needs the same model/prompt version, the same retrieved documents and a
+    query embedding within `similarity` cosine of a cached question, so
+    "what does figure 1 show" and "describe fig 1" can share one Gemini call.
+    Entries expire after `ttl` seconds, the least recently used are evicted past
+    `max_entries`, and re-ingesting a source drops every answer built on it.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity=ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                version TEXT NOT NULL,
+                context_key TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_key ON answers(version, context_key);
+            CREATE INDEX IF NOT EXISTS idx_answers_access ON answers(last_access);
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, query_vector, doc_keys, version):
+        """
+        Cached answer for a question over these documents, or None.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, embedding, answer FROM answers WHERE version = ? AND context_key = ? AND created_at >= ?",
+                (version, context_key(doc_keys), now - self.ttl)
+            ).fetchall()
+            best_id, best_answer, best_score = None, None, self.similarity
+            for entry_id, blob, answer in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if vector.shape != query.shape:
+                    continue
+                score = float(vector @ query) / ((np.linalg.norm(vector) or 1.0) * query_norm)
+                if score >= best_score:
+                    best_id, best_answer, best_score = entry_id, answer, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (now, best_id))
+            self._conn.commit()
+            return best_answer
+
+    def put(self, question, query_vector, doc_keys, sources, version, answer):
+        now = time.time()
+        blob = np.asarray(query_vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (version, context_key, sources, question, embedding, answer, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (version, context_key(doc_keys), json.dumps(sorted(set(sources))), question, blob, answer, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def invalidate_source(self, source):
+        """
+        Drops every answer whose context came from `source` (called on re-ingestion).
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT id, sources FROM answers").fetchall()
+            stale = [(entry_id,) for entry_id, sources in rows if source in json.loads(sources)]
+            if stale:
+                self._conn.executemany("DELETE FROM answers WHERE id = ?", stale)
+                self._conn.commit()
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
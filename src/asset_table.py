@@ -0,0 +1,193 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from src.config import CHROMA_DB_DIR, COLLECTION_NAME, RENDER_ZOOM, REGION_NEAR_DISTANCE
+
+# Image reference schema. Assets are stored per page; a row is
+#   {"asset_id", "source", "page", "kind", "bbox", "path", "width", "height", "bytes"}
+# with asset_id "<document key>:<page>:<index>" (document key: short hash of the doc ID).
+# kind "image": an image file on disk (extracted image, rendered page), measured at
+#   ingest. Every chunk of the page shows them, so chunks carry no reference: their
+#   source + page metadata is the (doc, page) key the images are looked up by.
+# kind "region": a figure region of a page (bbox in PDF points); the crop is rendered
+#   on demand, so "path" and "bytes" are empty and width/height are the crop's pixel size.
+#   A chunk lists the indices of the regions near its text in metadata["image_regions"].
+_COLUMNS = ("asset_id", "source", "page", "kind", "bbox", "path", "width", "height", "bytes")
+
+
+def format_bbox(bbox):
+    return ",".join(f"{v:.1f}" for v in bbox) if bbox else None
+
+
+def parse_bbox(value):
+    """
+    "x0,y0,x1,y1" -> (x0, y0, x1, y1); None for empty values.
+    """
+    if not value:
+        return None
+    return tuple(float(v) for v in value.split(","))
+
+
+def document_key(doc_id):
+    return hashlib.sha1(doc_id.encode("utf-8")).hexdigest()[:12]
+
+
+def asset_id(doc_id, page, index):
+    return f"{document_key(doc_id)}:{page}:{index}"
+
+
+def region_size(bbox, zoom=RENDER_ZOOM):
+    """
+    Pixel (width, height) of a region crop rendered at `zoom`.
+    """
+    return round((bbox[2] - bbox[0]) * zoom), round((bbox[3] - bbox[1]) * zoom)
+
+
+def image_size(path):
+    """
+    (width, height, bytes) of an image file; only the header is read.
+    Unreadable files give (None, None, None).
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+        return width, height, os.path.getsize(path)
+    except (OSError, ValueError):
+        return None, None, None
+
+
+def region_asset(doc_id, source, page, bbox, index):
+    width, height = region_size(bbox)
+    return {"asset_id": asset_id(doc_id, page, index), "source": source, "page": page, "kind": "region",
+            "bbox": tuple(bbox), "path": None, "width": width, "height": height, "bytes": None}
+
+
+def build_page_assets(doc_id, source, page, regions=(), images=()):
+    """
+    Asset rows for one page: figure regions (bboxes) first, then image files.
+    """
+    assets = [region_asset(doc_id, source, page, bbox, i) for i, bbox in enumerate(regions)]
+    for path in images:
+        width, height, size = image_size(path)
+        assets.append({"asset_id": asset_id(doc_id, page, len(assets)), "source": source, "page": page,
+                       "kind": "image", "bbox": None, "path": path, "width": width, "height": height, "bytes": size})
+    return assets
+
+
+def near_regions(assets, text_bbox=None):
+    """
+    Indices of the page's figure regions overlapping or near a chunk's text
+    (all regions when its position is unknown).
+    """
+    near = []
+    for index, asset in enumerate(assets):
+        if asset["kind"] != "region":
+            continue
+        bbox = asset["bbox"]
+        if text_bbox is not None and bbox is not None:
+            gap = max(bbox[0] - text_bbox[2], text_bbox[0] - bbox[2], bbox[1] - text_bbox[3], text_bbox[1] - bbox[3], 0)
+            if gap > REGION_NEAR_DISTANCE:
+                continue
+        near.append(index)
+    return near
+
+
+class AssetTable:
+    """
+    Visual assets of indexed pages, stored once per page instead of on every chunk.
+
+    For fast-mode PDFs these are figure regions (image bounding boxes and vector
+    drawing clusters found by PyMuPDF); the crop itself is rendered on demand
+    through src/page_cache.py. Extractor- and vision-mode pages store their image
+    files. Chunks reference them by page (see the schema above), so the prompt
+    builder knows every image's size before it opens or renders anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS assets (
+                asset_id TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                bbox TEXT,
+                path TEXT,
+                width INTEGER,
+                height INTEGER,
+                bytes INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_assets_page ON assets(doc_id, page);
+            """
+        )
+        # Tables created before image files and sizes were stored
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(assets)")}
+        for name, column_type in (("path", "TEXT"), ("width", "INTEGER"), ("height", "INTEGER"), ("bytes", "INTEGER")):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE assets ADD COLUMN {name} {column_type}")
+        self._conn.commit()
+
+    def _asset(self, row):
+        asset = dict(zip(_COLUMNS, row))
+        asset["bbox"] = parse_bbox(asset["bbox"])
+        return asset
+
+    def replace_page(self, doc_id, source, page, assets):
+        """
+        Replaces the assets stored for a page with `assets` (see build_page_assets()).
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM assets WHERE doc_id = ? AND page = ?", (doc_id, page))
+            self._conn.executemany(
+                "INSERT INTO assets (asset_id, doc_id, source, page, kind, bbox, path, width, height, bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(a["asset_id"], doc_id, source, page, a["kind"], format_bbox(a["bbox"]), a["path"],
+                  a["width"], a["height"], a["bytes"]) for a in assets]
+            )
+            self._conn.commit()
+
+    def page_assets(self, doc_id, page):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM assets WHERE doc_id = ? AND page = ? ORDER BY rowid",
+                (doc_id, page)
+            ).fetchall()
+        return [self._asset(r) for r in rows]
+
+    def chunk_assets(self, doc_id, page, regions=()):
+        """
+        Assets shown with a chunk: the page's image files plus the figure regions
+        whose indices it lists (metadata["image_regions"]).
+        """
+        wanted = {asset_id(doc_id, page, i) for i in regions}
+        return [a for a in self.page_assets(doc_id, page) if a["kind"] == "image" or a["asset_id"] in wanted]
+
+    def remove_pages(self, doc_id, pages):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM assets WHERE doc_id = ? AND page = ?", [(doc_id, p) for p in pages]
+            )
+            self._conn.commit()
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM assets WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM assets")
+            self._conn.commit()
+
+
+def asset_table_path(collection_name=COLLECTION_NAME):
+    # Next to chroma_db, like the registry and the other side indexes
+    return os.path.join(CHROMA_DB_DIR, f"assets_{collection_name}.sqlite")
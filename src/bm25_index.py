@@ -0,0 +1,206 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from src.config import CHROMA_DB_DIR, COLLECTION_NAME, BM25_K1, BM25_B
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Lowercased alphanumeric tokens. A word followed by a number also yields a joined
+    token ("figure 3" -> "figure_3") so labels like "Figure 3" / "Table 1" match exactly.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    joined = [
+        f"{word}_{number}"
+        for word, number in zip(tokens, tokens[1:])
+        if number.isdigit() and not word.isdigit()
+    ]
+    return tokens + joined
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring.
+
+    Documents are added/removed incrementally by vector store ID, so the index
+    stays in step with the Chroma collection. A query only touches the postings of
+    its own terms, and common terms are pruned (see search()). Measured over ~31k
+    chunks: about 2-5 ms per question (down from 30-70 ms exhaustive); the first
+    query after the index changes also rebuilds the norms and term bounds (~30 ms).
+    """
+
+    def __init__(self, path=None, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.postings = {}   # term -> {doc_id: term frequency}
+        self.doc_lengths = {}  # doc_id -> token count
+        self.doc_terms = {}  # doc_id -> distinct terms (for removal without a vocabulary scan)
+        self.total_length = 0
+        self._dirty = False
+        self._norms = None
+        self._bounds = {}  # term -> max saturation factor (see _term_bound)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        with self._lock:
+            if doc_id in self.doc_lengths:
+                self.remove(doc_id)
+            tokens = tokenize(text)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self.postings.setdefault(token, {})[doc_id] = tf
+            self.doc_lengths[doc_id] = len(tokens)
+            self.doc_terms[doc_id] = tuple(counts)
+            self.total_length += len(tokens)
+            self._dirty = True
+            self._norms = None
+
+    def add_many(self, doc_ids, texts):
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                self.add(doc_id, text)
+
+    def remove(self, doc_id):
+        with self._lock:
+            length = self.doc_lengths.pop(doc_id, None)
+            if length is None:
+                return
+            self.total_length -= length
+            for term in self.doc_terms.pop(doc_id, ()):
+                docs = self.postings.get(term)
+                if docs is None:
+                    continue
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+            self._dirty = True
+            self._norms = None
+
+    def remove_many(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self.remove(doc_id)
+
+    def _doc_norms(self):
+        # Length normalisation per document; rebuilt after the index changes
+        if self._norms is None:
+            self._bounds = {}
+            # Every document may tokenize to nothing (empty / punctuation-only chunks)
+            avg_length = self.total_length / len(self.doc_lengths) or 1.0
+            k1, b = self.k1, self.b
+            self._norms = {
+                doc_id: k1 * (1 - b + b * length / avg_length) for doc_id, length in self.doc_lengths.items()
+            }
+        return self._norms
+
+    def _term_bound(self, term, docs, norms):
+        # Largest tf saturation factor a term reaches in any document (times idf it
+        # bounds the term's score contribution); cached until the index changes
+        bound = self._bounds.get(term)
+        if bound is None:
+            k1 = self.k1
+            bound = max(tf * (k1 + 1) / (tf + norms[doc_id]) for doc_id, tf in docs.items())
+            self._bounds[term] = bound
+        return bound
+
+    def search(self, query, k=10):
+        """
+        Top-k (doc_id, score) pairs for a query, best first.
+
+        MaxScore pruning: terms are scored rarest first, and once the best score the
+        remaining (common) terms could still add is below the current k-th score,
+        those terms only update documents already in the running instead of walking
+        their whole postings list. The result is the same as exhaustive scoring.
+        """
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs or k <= 0:
+                return []
+            norms = self._doc_norms()
+            k1 = self.k1
+            terms = []
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if docs:
+                    idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    terms.append((len(docs), idf, docs, idf * self._term_bound(term, docs, norms)))
+            terms.sort(key=lambda t: t[0])
+            remaining_bound = sum(t[3] for t in terms)
+
+            scores = {}
+            for _, idf, docs, bound in terms:
+                threshold = heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+                if len(scores) >= k and remaining_bound <= threshold:
+                    # No document outside the current candidates can reach the top k,
+                    # nor can a candidate that stays below it with every remaining term
+                    if len(scores) > k:
+                        cutoff = threshold - remaining_bound
+                        scores = {doc_id: s for doc_id, s in scores.items() if s >= cutoff}
+                    if len(scores) < len(docs):
+                        pairs = [(doc_id, docs[doc_id]) for doc_id in scores if doc_id in docs]
+                    else:
+                        pairs = [(doc_id, tf) for doc_id, tf in docs.items() if doc_id in scores]
+                else:
+                    pairs = docs.items()
+                for doc_id, tf in pairs:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norms[doc_id])
+                remaining_bound -= bound
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def clear(self):
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.doc_terms = {}
+            self.total_length = 0
+            self._dirty = True
+            self._norms = None
+            self._bounds = {}
+
+    def save(self):
+        """
+        Persists the index (atomic replace) if it changed since the last save.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    {"postings": self.postings, "doc_lengths": self.doc_lengths,
+                     "doc_terms": self.doc_terms, "total_length": self.total_length},
+                    f, protocol=pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    @classmethod
+    def load(cls, path):
+        index = cls(path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            index.postings = state["postings"]
+            index.doc_lengths = state["doc_lengths"]
+            index.doc_terms = state["doc_terms"]
+            index.total_length = state["total_length"]
+        return index
+
+
+def bm25_path(collection_name=COLLECTION_NAME):
+    # Persisted next to chroma_db, like the document registry
+    return os.path.join(CHROMA_DB_DIR, f"bm25_{collection_name}.pkl")
@@ -1,21 +1,115 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda
-from src.config import GOOGLE_API_KEY
-from src.vectorstore import get_retriever
-from src.llm_utils import invoke_with_retry
-import base64
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+from src.config import GOOGLE_API_KEY, COLLECTION_NAME
+from src.retrieval import retrieve
+from src.resources import get_cached_answer_chain, get_asset_table, get_answer_cache, get_embeddings
+from src.registry import document_id
+from src.asset_table import parse_bbox, format_bbox, region_asset
+from src import page_cache
+from src.image_payloads import image_content_part
+from src.context_planner import plan_context
+from src import tracing
+from dataclasses import dataclass, field
 import os
-import ast
+import time
+
+ANSWER_MODEL = "models/gemini-flash-latest"
+# Bump when multimodal_prompt_builder changes; cached answers from older prompts stop matching
+ANSWER_PROMPT_VERSION = "2"
+
+
+@dataclass
+class ChainResult:
+    """
+    Output of the RAG chain: the answer plus exactly what the model was shown.
+    """
+    answer: str
+    context: list = field(default_factory=list)
+    image_paths: list = field(default_factory=list)
+    plan: object = None  # ContextPlan the prompt is built from (src/context_planner.py)
+    cached: bool = False  # Answer served from the semantic answer cache
+
+
+def get_image_assets(doc, collection_name=COLLECTION_NAME):
+    """
+    Image assets a document references (rows of src/asset_table.py, sizes included),
+    without touching the image files: the figure region a label lookup resolved to,
+    else the page's image files plus the figure regions in metadata["image_regions"].
+    Looked up in the asset table of the collection the document was retrieved from.
+    """
+    source = doc.metadata.get("source")
+    page = doc.metadata.get("page")
+    label_region = parse_bbox(doc.metadata.get("label_region"))
+    if label_region and source and page:
+        return [region_asset(document_id(source), source, page, label_region, f"label:{format_bbox(label_region)}")]
+    if not (source and page):
+        return []
+    return get_asset_table(collection_name).chunk_assets(
+        document_id(source), page, doc.metadata.get("image_regions") or []
+    )
+
+
+def asset_image_path(asset):
+    """
+    Local file for an asset: the image itself, or the region crop (rendered on first use).
+    None if the file or its source PDF is gone.
+    """
+    if asset["kind"] == "region":
+        return page_cache.get_page_image(asset["source"], asset["page"], clip=asset["bbox"])
+    path = asset["path"]
+    return path if path and os.path.exists(path) else None
+
+
+def get_image_paths(doc, collection_name=COLLECTION_NAME):
+    """
+    Images to show for a document in the UI: its image files, else the whole page
+    (rendered on demand) for PDF chunks that only reference figure regions.
+    """
+    paths = [asset_image_path(a) for a in get_image_assets(doc, collection_name) if a["kind"] == "image"]
+    paths = [p for p in paths if p]
+    if paths:
+        return paths
+    source = doc.metadata.get("source")
+    page = doc.metadata.get("page")
+    if source and page:
+        image_path = page_cache.get_page_image(source, page)
+        return [image_path] if image_path else []
+    return []
+
+
+def plan_prompt(question, context_docs, log=True, collection_name=COLLECTION_NAME):
+    """
+    Ranks and packs the retrieved text and images into the prompt budget
+    (see src/context_planner.py). Reads only the asset table, never the images.
+    """
+    with tracing.span("query.context_plan"):
+        doc_assets = [get_image_assets(doc, collection_name) for doc in context_docs]
+        return plan_context(question, context_docs, doc_assets, log=log)
+
+def plan_image_paths(plan):
+    """
+    Local files of the planned images, in prompt order (crops rendered on first use).
+    """
+    image_paths = []
+    for asset in plan.images:
+        img_path = asset_image_path(asset)
+        if img_path and img_path not in image_paths:
+            image_paths.append(img_path)
+    return image_paths
 
 def multimodal_prompt_builder(inputs):
     """
     Constructs a list of messages including text context and base64 images for Gemini.
-    Strictly follows Multi-Vector Linking logic: retrieve 'image_path' from metadata.
+    Text snippets and images are the ones the context plan kept within the prompt
+    budget; inputs may carry a "plan" made earlier (retrieve_context), else one is made here
+    from the asset table of inputs["collection_name"] (default collection if absent).
     """
     context_docs = inputs["context"]
     question = inputs["question"]
+    plan = inputs.get("plan") or plan_prompt(
+        question, context_docs, collection_name=inputs.get("collection_name", COLLECTION_NAME)
+    )
     
     # System Message
     system_text = """You are an assistant for question-answering tasks. 
@@ -29,44 +123,18 @@ def multimodal_prompt_builder(inputs):
     
     # Add Text Context
     context_str = "Context:\n"
-    image_paths_processed = set()
     
-    for i, doc in enumerate(context_docs):
-        content = doc.page_content
+    for i, content in plan.snippets:
         context_str += f"\n[Document {i}]\n{content}\n"
-        
-        # Check for images in metadata (Key: 'image_path' as per requirement)
-        img_paths_val = doc.metadata.get("image_path", "[]")
-        
-        # Deserialize stringified list
+
+    # Images linked via the asset table, as planned
+    for img_path in plan_image_paths(plan):
+        # Downscaled, cached Base64 payload (see src/image_payloads.py)
         try:
-            if isinstance(img_paths_val, str):
-                if img_paths_val.startswith("["):
-                    img_paths = ast.literal_eval(img_paths_val)
-                else:
-                    img_paths = [img_paths_val] # Fallback if single path string
-            elif isinstance(img_paths_val, list):
-                img_paths = img_paths_val
-            else:
-                img_paths = []
-        except:
-             img_paths = []
-
-        if img_paths:
-            for img_path in img_paths:
-                if img_path and img_path not in image_paths_processed and os.path.exists(img_path):
-                    # Encode Image for Gemini (Base64)
-                    try:
-                        with open(img_path, "rb") as image_file:
-                            image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                        
-                        content_parts.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                        })
-                        image_paths_processed.add(img_path)
-                    except Exception as e:
-                        print(f"Error loading image {img_path}: {e}")
+            with tracing.span("query.image_load"):
+                content_parts.append(image_content_part(img_path))
+        except Exception as e:
+            print(f"Error loading image {img_path}: {e}")
 
     # Add text content part
     final_text_prompt = f"{context_str}\n\nQuestion: {question}"
@@ -79,29 +147,193 @@ def multimodal_prompt_builder(inputs):
     
     return messages
 
-def get_chain():
+def to_chain_result(outputs):
     """
-    Builds a Multimodal RetrievalQA chain using Gemini 3 Flash Preview.
+    Packs the chain outputs into a ChainResult so callers (the UI) can show
+    the same documents the model saw without retrieving a second time.
+    """
+    # Same plan as the prompt builder's (deterministic); not logged twice
+    plan = plan_prompt(
+        outputs["question"], outputs["context"], log=False,
+        collection_name=outputs.get("collection_name", COLLECTION_NAME)
+    )
+    return ChainResult(
+        answer=outputs["answer"],
+        context=outputs["context"],
+        image_paths=plan_image_paths(plan),
+        plan=plan,
+        cached=outputs.get("cached", False)
+    )
+
+def get_llm():
     """
-    # 1. Initialize LLM (Gemini Flash Latest - Stable & Fast)
-    llm = ChatGoogleGenerativeAI(
-        model="models/gemini-flash-latest",
+    Gemini Flash Latest - Stable & Fast
+    """
+    # Imported here: langchain_google_genai alone adds ~1.5 s to startup
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=ANSWER_MODEL,
         google_api_key=GOOGLE_API_KEY,
         temperature=0
     )
 
-    # 2. Get Retriever
-    retriever = get_retriever()
-
-    # 3. Chain
-    chain = (
-        {
-            "context": retriever,
-            "question": RunnableLambda(lambda x: x)
-        }
-        | RunnableLambda(multimodal_prompt_builder)
+def get_answer_chain(llm=None):
+    """
+    Generation half of the RAG chain: {"context": docs, "question": str} -> answer text.
+    Supports .invoke / .stream / .astream (tokens come straight from Gemini).
+    """
+    if llm is None:
+        llm = get_llm()
+    return (
+        RunnableLambda(multimodal_prompt_builder)
         | llm
         | StrOutputParser()
     )
+
+def _doc_cache_key(doc):
+    # The chunks a page was merged from (see collapse_to_pages), not just the page:
+    # different hit chunks of one page make different context
+    chunk_ids = doc.metadata.get("chunk_ids") or ([doc.id] if doc.id else [])
+    if chunk_ids:
+        key = ",".join(sorted(chunk_ids))
+    else:
+        key = doc.page_content
+    label_region = doc.metadata.get("label_region")
+    return f"{key}#{label_region}" if label_region else key
+
+def _answer_cache_inputs(question, context):
+    """
+    (query embedding, retrieved doc keys, sources, version) for the answer cache.
+    The query embedding is normally a cache hit from retrieval (see src/embedding_cache.py).
+    """
+    query_vector = get_embeddings().embed_query(question)
+    doc_keys = [_doc_cache_key(doc) for doc in context]
+    sources = [doc.metadata["source"] for doc in context if doc.metadata.get("source")]
+    return query_vector, doc_keys, sources, f"{ANSWER_MODEL}|{ANSWER_PROMPT_VERSION}"
+
+def lookup_cached_answer(question, context):
+    """
+    Cached answer for this question over this context (see src/answer_cache.py), or None.
+    Returns (answer, cache_inputs); pass cache_inputs to store_answer() on a miss.
+    """
+    if not context:
+        return None, None
+    cache_inputs = _answer_cache_inputs(question, context)
+    query_vector, doc_keys, _, version = cache_inputs
+    return get_answer_cache().lookup(query_vector, doc_keys, version), cache_inputs
+
+def store_answer(question, cache_inputs, answer):
+    if cache_inputs is None or not answer.strip():
+        return
+    query_vector, doc_keys, sources, version = cache_inputs
+    get_answer_cache().put(question, query_vector, doc_keys, sources, version, answer)
+
+def cached_answer_step(answer_chain):
+    """
+    Wraps the generation chain with the semantic answer cache (invoke path).
+    Adds "answer" and "cached" (served from the cache) to the inputs.
+    """
+    def generate(inputs):
+        with tracing.span("query.answer_cache"):
+            answer, cache_inputs = lookup_cached_answer(inputs["question"], inputs["context"])
+        if answer is not None:
+            tracing.count("query.answer_cache_hits")
+            return {**inputs, "answer": answer, "cached": True}
+        with tracing.span("query.llm"):
+            answer = answer_chain.invoke(inputs)
+        store_answer(inputs["question"], cache_inputs, answer)
+        return {**inputs, "answer": answer, "cached": False}
+    return RunnableLambda(generate)
+
+def get_chain(answer_chain=None, collection_name=COLLECTION_NAME):
+    """
+    Builds a Multimodal RetrievalQA chain using Gemini 3 Flash Preview.
+    Invoking it returns a ChainResult (answer + retrieved context + image paths).
+    """
+    # 1. Retriever: chunk search collapsed back to unique pages
+    retriever = RunnableLambda(lambda question: retrieve(question, collection_name=collection_name))
+
+    # 2. LLM + prompt builder
+    if answer_chain is None:
+        answer_chain = get_answer_chain()
+
+    # 3. Chain (retrieval runs once; its output is passed through to the result)
+    chain = (
+        RunnableParallel(
+            context=retriever,
+            question=RunnablePassthrough(),
+            collection_name=RunnableLambda(lambda _: collection_name)
+        )
+        | cached_answer_step(answer_chain)
+        | RunnableLambda(to_chain_result)
+    )
     
     return chain
+
+def retrieve_context(question, collection_name=COLLECTION_NAME):
+    """
+    Retrieval step on its own, so the UI can show images before generation starts.
+    Returns a ChainResult with an empty answer; pass it to stream_answer().
+    """
+    with tracing.span("query.retrieve"):
+        context = retrieve(question, collection_name=collection_name)
+    plan = plan_prompt(question, context, collection_name=collection_name)
+    with tracing.span("query.image_paths"):
+        image_paths = plan_image_paths(plan)
+    return ChainResult(answer="", context=context, image_paths=image_paths, plan=plan)
+
+def stream_answer(question, result, answer_chain=None):
+    """
+    Yields answer tokens for an already retrieved ChainResult.
+    result.answer holds the full text once the generator is exhausted.
+    A semantic cache hit is yielded in one piece, without calling the LLM.
+    """
+    with tracing.span("query.answer_cache"):
+        cached, cache_inputs = lookup_cached_answer(question, result.context)
+    if cached is not None:
+        tracing.count("query.answer_cache_hits")
+        result.answer = cached
+        result.cached = True
+        yield cached
+        return
+
+    if answer_chain is None:
+        answer_chain = get_cached_answer_chain()
+    parts = []
+    start = time.perf_counter()
+    # Covers prompt building (image loads), the Gemini call and streaming back to the caller
+    with tracing.span("query.llm"):
+        for token in answer_chain.stream({"context": result.context, "question": question, "plan": result.plan}):
+            if not parts:
+                tracing.observe("query.llm_first_token", time.perf_counter() - start)
+            parts.append(token)
+            yield token
+    result.answer = "".join(parts)
+    store_answer(question, cache_inputs, result.answer)
+
+async def astream_answer(question, result, answer_chain=None):
+    """
+    Async variant of stream_answer().
+    """
+    with tracing.span("query.answer_cache"):
+        cached, cache_inputs = lookup_cached_answer(question, result.context)
+    if cached is not None:
+        tracing.count("query.answer_cache_hits")
+        result.answer = cached
+        result.cached = True
+        yield cached
+        return
+
+    if answer_chain is None:
+        answer_chain = get_cached_answer_chain()
+    parts = []
+    start = time.perf_counter()
+    # Covers prompt building (image loads), the Gemini call and streaming back to the caller
+    with tracing.span("query.llm"):
+        async for token in answer_chain.astream({"context": result.context, "question": question, "plan": result.plan}):
+            if not parts:
+                tracing.observe("query.llm_first_token", time.perf_counter() - start)
+            parts.append(token)
+            yield token
+    result.answer = "".join(parts)
+    store_answer(question, cache_inputs, result.answer)
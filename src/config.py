@@ -3,22 +3,102 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Importing this module has no side effects beyond reading .env: nothing is created
+# and missing keys are only reported by the code that needs them (e.g. get_llm()).
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # Only used by tools/list_groq_models.py
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY is not set in environment variables")
-if not GOOGLE_API_KEY:
-    # Not raising error strictly if we don't use it, but for this hybrid plan we need it.
-    pass
-
 # Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+# RAG_DATA_DIR points everything (input, assets, vector store, caches) elsewhere, e.g. for benchmarks
+DATA_DIR = os.getenv("RAG_DATA_DIR") or os.path.join(BASE_DIR, "data")
 INPUT_DIR = os.path.join(DATA_DIR, "input")
 ASSETS_DIR = os.path.join(DATA_DIR, "assets")
 CHROMA_DB_DIR = os.path.join(DATA_DIR, "chroma_db")
+PAGE_CACHE_DIR = os.path.join(ASSETS_DIR, "page_cache")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+DESCRIPTION_CACHE_PATH = os.path.join(CACHE_DIR, "descriptions.sqlite")
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+IMAGE_PAYLOAD_CACHE_DIR = os.path.join(CACHE_DIR, "image_payloads")
+ANSWER_CACHE_PATH = os.path.join(CACHE_DIR, "answers.sqlite")
+JOB_DB_PATH = os.path.join(DATA_DIR, "jobs.sqlite")
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+# Vector Store
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+COLLECTION_NAME = "rag_collection"
+EMBEDDING_BATCH_SIZE = 32  # Texts per model call; tune to CPU/GPU memory
+
+# Ingestion
+RENDER_ZOOM = 2  # Page image resolution multiplier
+RENDER_WORKERS = max(1, (os.cpu_count() or 1) - 1)  # Leave one core for the UI thread
+PRERENDER_PAGES = False  # Warm the page image cache during fast-mode ingestion (otherwise pages render on first use)
+INDEX_BATCH_SIZE = 64  # Documents per add_documents call
+CHUNK_SIZE = 800  # Characters per fast-mode chunk (MiniLM truncates at ~256 word pieces)
+CHUNK_OVERLAP = 150  # Characters carried over from the previous chunk
+FIGURE_MIN_SIZE = 40  # Ignore image/drawing regions smaller than this (points)
+FIGURE_PADDING = 6  # Points added around figure crops
+EXTRACT_WORKERS = RENDER_WORKERS  # Unstructured partition processes (extractor mode)
+EXTRACT_PAGES_PER_SHARD = 4  # Pages per partition call; smaller shards balance better, larger ones amortize model load
+EXTRACT_TABLE_MODE = "detected"  # "all": table inference on every page; "detected": only pages with tables/figures
+JOB_WORKERS = 1  # Background ingestion workers (jobs of one collection run one at a time anyway)
+JOB_POLL_INTERVAL = 2  # Seconds between queue checks / UI status refreshes
+
+# Retrieval
+RETRIEVAL_K = 2  # Pages passed to the LLM
+RETRIEVAL_FETCH_K = 8  # Chunks fetched before collapsing hits back to pages
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant for vector + BM25 hits
+LABEL_SOURCE_HITS = 8  # Fused hits that decide which document a label means when several have it
+RERANK_ENABLED = True  # Cross-encoder rerank of the fused candidates (src/reranker.py)
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 30  # Chunks fetched for reranking (instead of RETRIEVAL_FETCH_K)
+RERANK_BATCH_SIZE = 16  # (query, chunk) pairs per model call
+RERANK_BUDGET_MS = 400  # Past this, keep the fused order (model load excluded)
+RERANK_CACHE_SIZE = 4096  # Cached (query, chunk) scores
+REGION_NEAR_DISTANCE = 72  # Figure crops within this many points of the retrieved text are sent
+
+# Semantic answer cache (same retrieved docs + similar question -> reuse answer)
+ANSWER_CACHE_SIMILARITY = 0.9  # Minimum cosine similarity between question embeddings
+ANSWER_CACHE_TTL = 24 * 60 * 60  # Seconds
+ANSWER_CACHE_MAX_ENTRIES = 2000
+
+# Vision describer (Gemini free tier limits; raise for paid quotas)
+VISION_MAX_CONCURRENCY = 4
+VISION_REQUESTS_PER_MINUTE = 10
+VISION_TOKENS_PER_MINUTE = 250000
+DESCRIPTION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Cached page descriptions (text only)
+
+# Tracing (src/tracing.py): per-stage spans/counters, exported after each question / ingestion
+TRACING_ENABLED = os.getenv("RAG_TRACING", "1") != "0"
+TRACE_LOG_PATH = os.path.join(METRICS_DIR, "traces.jsonl")  # One JSON line per trace ("" disables)
+TRACE_LOG_MAX_BYTES = 16 * 1024 * 1024  # Rotated to traces.jsonl.1 past this size
+METRICS_PROM_PATH = os.path.join(METRICS_DIR, "metrics.prom")  # Prometheus text format ("" disables)
+
+# Page images are rendered on first use and kept in an LRU cache on disk
+PAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Images sent to Gemini are downscaled and recompressed once, then reused
+PROMPT_IMAGE_MAX_DIM = 1024  # Longest side in pixels
+PROMPT_IMAGE_FORMAT = "JPEG"  # JPEG or WEBP
+PROMPT_IMAGE_QUALITY = 80
+IMAGE_PAYLOAD_CACHE_MAX_BYTES = 128 * 1024 * 1024
+IMAGE_PAYLOAD_MEMORY_ITEMS = 64  # base64 strings kept in memory
+
+# Prompt budget (src/context_planner.py): retrieved text and images are ranked and
+# packed into this many estimated input tokens (instructions and question excluded)
+PROMPT_TOKEN_BUDGET = 8000
+PROMPT_MAX_IMAGES = 4
+PROMPT_SNIPPET_MAX_TOKENS = 1500  # Longer pages are trimmed to their most relevant spans
+PROMPT_MIN_SNIPPET_TOKENS = 64  # Leftover budget below this is not used for a trimmed snippet
+CHARS_PER_TOKEN = 4  # Rough text token estimate
+IMAGE_TOKENS_PER_TILE = 258  # Gemini image cost per 768 px tile (one tile up to 384 px)
 
-os.makedirs(INPUT_DIR, exist_ok=True)
-os.makedirs(ASSETS_DIR, exist_ok=True)
-os.makedirs(CHROMA_DB_DIR, exist_ok=True)
+def ensure_data_dirs():
+    """
+    Creates the data directories. Called by app.py at startup; the tools rely on the
+    stores and caches, which create their own directory on first use.
+    """
+    for path in (INPUT_DIR, ASSETS_DIR, CHROMA_DB_DIR, PAGE_CACHE_DIR, CACHE_DIR, IMAGE_PAYLOAD_CACHE_DIR, METRICS_DIR):
+        os.makedirs(path, exist_ok=True)
@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from src.config import (
+    PROMPT_TOKEN_BUDGET, PROMPT_MAX_IMAGES, PROMPT_SNIPPET_MAX_TOKENS, PROMPT_MIN_SNIPPET_TOKENS,
+    CHARS_PER_TOKEN, IMAGE_TOKENS_PER_TILE, PROMPT_IMAGE_MAX_DIM
+)
+from src.bm25_index import tokenize
+from src import tracing
+
+# Gemini bills an image as one tile if both sides are at most 384 px, otherwise
+# as 768 x 768 tiles.
+_SMALL_IMAGE_PX = 384
+_TILE_PX = 768
+_SPAN_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+@dataclass
+class ContextPlan:
+    """
+    What goes into the prompt: (document index, text) snippets and image assets,
+    best first, with the estimated token cost and what did not fit.
+    """
+    snippets: list = field(default_factory=list)
+    images: list = field(default_factory=list)
+    tokens: int = 0
+    trimmed: int = 0
+    dropped: list = field(default_factory=list)
+
+
+def estimate_text_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_image_tokens(asset, max_dim=PROMPT_IMAGE_MAX_DIM):
+    """
+    Token cost of an image as sent (downscaled to `max_dim`, see src/image_payloads.py).
+    Unknown sizes are costed as a full-size payload.
+    """
+    width, height = asset.get("width"), asset.get("height")
+    if not width or not height:
+        width = height = max_dim
+    scale = min(1.0, max_dim / max(width, height))
+    width, height = width * scale, height * scale
+    if width <= _SMALL_IMAGE_PX and height <= _SMALL_IMAGE_PX:
+        return IMAGE_TOKENS_PER_TILE
+    return math.ceil(width / _TILE_PX) * math.ceil(height / _TILE_PX) * IMAGE_TOKENS_PER_TILE
+
+
+def trim_to_relevant(text, query_terms, max_tokens):
+    """
+    Keeps the spans (sentences / lines) of `text` that best match the question, in
+    reading order, within `max_tokens`. Gaps are marked with "...".
+    A span scores the question terms it contains, each weighted by how few spans of
+    this text contain it, so common words ("the", "of") barely count.
+    """
+    if estimate_text_tokens(text) <= max_tokens:
+        return text
+    spans = [s.strip() for s in _SPAN_RE.split(text) if s.strip()]
+    span_terms = [query_terms.intersection(tokenize(s)) for s in spans]
+    frequency = {}
+    for terms in span_terms:
+        for term in terms:
+            frequency[term] = frequency.get(term, 0) + 1
+    scores = [sum(1.0 / frequency[t] for t in terms) for terms in span_terms]
+    ranked = sorted(range(len(spans)), key=lambda i: (-scores[i], i))
+    keep = set()
+    used = 0
+    for i in ranked:
+        cost = estimate_text_tokens(spans[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+    if not keep:
+        # A single span longer than the limit: its start is better than nothing
+        return spans[ranked[0]][:max_tokens * CHARS_PER_TOKEN]
+    parts = []
+    previous = None
+    for i in sorted(keep):
+        if previous is not None and i != previous + 1:
+            parts.append("...")
+        parts.append(spans[i])
+        previous = i
+    return "\n".join(parts)
+
+
+def _label(doc, index):
+    source = doc.metadata.get("source")
+    page = doc.metadata.get("page")
+    if source and page is not None:
+        return f"document {index} ({os.path.basename(source)} p.{page})"
+    return f"document {index}"
+
+
+def plan_context(question, docs, doc_assets, budget=PROMPT_TOKEN_BUDGET, max_images=PROMPT_MAX_IMAGES,
+                 snippet_max_tokens=PROMPT_SNIPPET_MAX_TOKENS, log=True):
+    """
+    Packs retrieved text and images into a token budget.
+
+    docs arrive ranked by retrieval (rerank / fused score), doc_assets[i] being the
+    image assets of docs[i] (rows of src/asset_table.py, sizes included). Candidates
+    are taken in that order, each document's text before its images. Text longer
+    than `snippet_max_tokens`, or than what is left of the budget, is trimmed to its
+    most relevant spans; images that don't fit are skipped so smaller items further
+    down can still use the room. Nothing here opens an image file.
+    """
+    plan = ContextPlan()
+    query_terms = set(tokenize(question))
+    remaining = budget
+    seen_assets = set()
+
+    for index, (doc, assets) in enumerate(zip(docs, doc_assets)):
+        text = doc.page_content.strip()
+        if text:
+            limit = min(snippet_max_tokens, remaining)
+            if limit < min(PROMPT_MIN_SNIPPET_TOKENS, estimate_text_tokens(text)):
+                plan.dropped.append(f"{_label(doc, index)} text (~{estimate_text_tokens(text)} tokens)")
+            else:
+                snippet = trim_to_relevant(text, query_terms, limit)
+                if snippet != text:
+                    plan.trimmed += 1
+                cost = estimate_text_tokens(snippet)
+                plan.snippets.append((index, snippet))
+                plan.tokens += cost
+                remaining -= cost
+
+        for asset in assets:
+            if asset["asset_id"] in seen_assets:
+                continue
+            seen_assets.add(asset["asset_id"])
+            cost = estimate_image_tokens(asset)
+            if len(plan.images) >= max_images or cost > remaining:
+                plan.dropped.append(f"{_label(doc, index)} image {asset['asset_id']} (~{cost} tokens)")
+                continue
+            plan.images.append(asset)
+            plan.tokens += cost
+            remaining -= cost
+
+    if log:
+        tracing.count("prompt.tokens_planned", plan.tokens)
+        tracing.count("prompt.snippets_trimmed", plan.trimmed)
+        tracing.count("prompt.items_dropped", len(plan.dropped))
+        if plan.dropped or plan.trimmed:
+            print(
+                f"Context plan: {len(plan.snippets)} snippets ({plan.trimmed} trimmed), "
+                f"{len(plan.images)} images, ~{plan.tokens}/{budget} tokens. "
+                f"Dropped: {'; '.join(plan.dropped) or 'nothing'}"
+            )
+    return plan
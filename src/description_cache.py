@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from src.config import DESCRIPTION_CACHE_PATH, DESCRIPTION_CACHE_MAX_BYTES
+
+
+def description_key(image_bytes, model_name, prompt):
+    """
+    Content address of a page description: the rendered page bytes plus the
+    model and prompt that produced it. Identical pages in different files share a key.
+    """
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    digest.update(b"\0")
+    digest.update((model_name or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DescriptionCache:
+    """
+    Persistent (SQLite) cache of vision descriptions with LRU eviction once the
+    stored text exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=DESCRIPTION_CACHE_PATH, max_bytes=DESCRIPTION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS descriptions (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                description TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_descriptions_access ON descriptions(last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT description FROM descriptions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE descriptions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, description, model_name=None):
+        size = len(description.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, model, description, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, description, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM descriptions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = []
+        for key, size in self._conn.execute("SELECT key, size FROM descriptions ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            removed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM descriptions WHERE key = ?", removed)
+
+    def stats(self):
+        """
+        Entry count, stored bytes and hit/miss counters for this process.
+        """
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM descriptions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM descriptions")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_description_cache():
+    """
+    Shared process-wide cache instance.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DescriptionCache()
+        return _default_cache
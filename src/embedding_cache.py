@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.config import EMBEDDING_CACHE_DIR, EMBEDDING_BATCH_SIZE
+from src import tracing
+
+DIGEST_SIZE = 20  # sha1
+
+
+class _FileLock:
+    """
+    Cross-process exclusive lock based on an O_EXCL lock file.
+    Ingestion workers and the UI process may append to the same cache.
+    """
+
+    def __init__(self, path, stale_after=60):
+        self.path = path
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except FileExistsError:
+                # A crashed writer must not block the cache forever
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    pass
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class VectorCache:
+    """
+    Append-only on-disk store of float32 vectors keyed by a text digest.
+
+    vectors.f32 holds the rows back to back (read through np.memmap),
+    keys.bin holds the matching 20-byte digests in the same order.
+    Vectors are written before their keys, so a torn write is simply ignored on load.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._keys_path = os.path.join(cache_dir, "keys.bin")
+        self._meta_path = os.path.join(cache_dir, "meta.json")
+        self._file_lock = _FileLock(os.path.join(cache_dir, ".lock"))
+        self._lock = threading.Lock()
+        self._index = {}
+        self._rows = 0
+        self._dim = None
+        self._memmap = None
+        self._load_meta()
+        self._refresh()
+
+    def _load_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self._dim = json.load(f)["dim"]
+
+    def _refresh(self):
+        """
+        Picks up rows appended since the last read (possibly by another process).
+        """
+        if self._dim is None:
+            self._load_meta()
+            if self._dim is None:
+                return
+        if not os.path.exists(self._keys_path):
+            return
+        vector_rows = os.path.getsize(self._vectors_path) // (self._dim * 4) if os.path.exists(self._vectors_path) else 0
+        key_rows = os.path.getsize(self._keys_path) // DIGEST_SIZE
+        rows = min(vector_rows, key_rows)
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * DIGEST_SIZE)
+            data = f.read((rows - self._rows) * DIGEST_SIZE)
+        for i in range(rows - self._rows):
+            self._index[data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]] = self._rows + i
+        self._rows = rows
+        self._memmap = None
+
+    def _vectors(self):
+        if self._memmap is None and self._rows:
+            self._memmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+        return self._memmap
+
+    def get_many(self, keys):
+        """
+        {key: vector} for the keys present in the cache.
+        """
+        with self._lock:
+            if any(k not in self._index for k in keys):
+                self._refresh()
+            vectors = self._vectors()
+            return {k: vectors[self._index[k]].tolist() for k in keys if k in self._index}
+
+    def put_many(self, items):
+        """
+        items: list of (key, vector)
+        """
+        if not items:
+            return
+        with self._lock, self._file_lock:
+            self._refresh()
+            items = [(k, v) for k, v in items if k not in self._index]
+            if not items:
+                return
+            array = np.asarray([v for _, v in items], dtype=np.float32)
+            if self._dim is None:
+                self._dim = array.shape[1]
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self._dim}, f)
+            # Truncate any torn tail so rows stay aligned with keys
+            expected = self._rows * self._dim * 4
+            with open(self._vectors_path, "ab") as f:
+                if f.tell() != expected:
+                    f.truncate(expected)
+                f.write(array.tobytes())
+            with open(self._keys_path, "ab") as f:
+                if f.tell() != self._rows * DIGEST_SIZE:
+                    f.truncate(self._rows * DIGEST_SIZE)
+                f.write(b"".join(k for k, _ in items))
+            self._refresh()
+
+    def __len__(self):
+        return self._rows
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with batching and a persistent vector cache.
+
+    Document texts are embedded in batches of `batch_size`, and only texts not
+    already cached (by sha1 of model + text) reach the model. Query embeddings are
+    cached both on disk and in a small in-memory LRU, so repeated questions skip the model.
+    """
+
+    def __init__(self, model, namespace, cache_dir=EMBEDDING_CACHE_DIR, batch_size=EMBEDDING_BATCH_SIZE, query_cache_size=1024):
+        self.model = model
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.store = VectorCache(os.path.join(cache_dir, hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]))
+        self._query_cache = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._query_lock = threading.Lock()
+        self.model_calls = 0
+
+    def _key(self, kind, text):
+        return hashlib.sha1(f"{self.namespace}\0{kind}\0{text}".encode("utf-8")).digest()
+
+    def embed_documents(self, texts):
+        keys = [self._key("doc", t) for t in texts]
+        found = self.store.get_many(set(keys))
+
+        # Embed each distinct missing text once, in batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        missing_items = list(missing.items())
+        tracing.count("embed.cache_hits", len(keys) - len(missing_items))
+        for start in range(0, len(missing_items), self.batch_size):
+            chunk = missing_items[start:start + self.batch_size]
+            with tracing.span("embed.documents", texts=len(chunk)):
+                vectors = self.model.embed_documents([t for _, t in chunk])
+            self.model_calls += 1
+            self.store.put_many([(k, v) for (k, _), v in zip(chunk, vectors)])
+            found.update({k: list(v) for (k, _), v in zip(chunk, vectors)})
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        with self._query_lock:
+            if key in self._query_cache:
+                self._query_cache.move_to_end(key)
+                tracing.count("embed.query_cache_hits")
+                return self._query_cache[key]
+
+        vector = self.store.get_many([key]).get(key)
+        if vector is None:
+            with tracing.span("embed.query"):
+                vector = list(self.model.embed_query(text))
+            self.model_calls += 1
+            self.store.put_many([(key, vector)])
+
+        with self._query_lock:
+            self._query_cache[key] = vector
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
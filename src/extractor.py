@@ -1,72 +1,176 @@
 from unstructured.partition.pdf import partition_pdf
-from src.config import ASSETS_DIR
+from concurrent.futures import ProcessPoolExecutor
+from src.config import ASSETS_DIR, EXTRACT_WORKERS, EXTRACT_PAGES_PER_SHARD, EXTRACT_TABLE_MODE
+import hashlib
 import os
+import shutil
+import tempfile
+
+# Unstructured element categories indexed as text chunks (Table/TableChunk -> "Table",
+# Text/UncategorizedText -> "UncategorizedText")
+TEXT_CATEGORIES = {"NarrativeText", "Title", "Table", "UncategorizedText"}
+
+
+def _partition_shard(shard_path, first_page, image_dir, layout):
+    """
+    Partitions one page range (written as its own PDF) in a worker process.
+    Page numbers are shifted back to the original document's numbering.
+    layout=False skips table inference / image extraction (plain text pages).
+    """
+    if layout:
+        elements = partition_pdf(
+            filename=shard_path,
+            extract_images_in_pdf=True,
+            extract_image_block_output_dir=image_dir,
+            infer_table_structure=True,
+        )
+    else:
+        elements = partition_pdf(filename=shard_path, strategy="fast")
+    for el in elements:
+        if el.metadata.page_number is not None:
+            el.metadata.page_number += first_page - 1
+    return elements
+
+
+def layout_pages(pdf_path):
+    """
+    1-based page numbers PyMuPDF flags as needing layout analysis: pages with a
+    table, an embedded image or a vector figure.
+    """
+    import fitz  # pymupdf
+    from src.visual_processor import find_figure_regions
+
+    flagged = set()
+    with fitz.open(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            if find_figure_regions(page):
+                flagged.add(i + 1)
+                continue
+            try:
+                if page.find_tables().tables:
+                    flagged.add(i + 1)
+            except AttributeError:
+                flagged.add(i + 1)  # PyMuPDF < 1.23 cannot detect tables; stay on the safe side
+    return flagged
+
+
+def plan_shards(page_count, pages_per_shard, layout=None):
+    """
+    [(first_page, last_page, needs_layout)]: consecutive pages with the same
+    layout flag, at most pages_per_shard per shard. layout=None flags every page.
+    """
+    shards = []
+    for page in range(1, page_count + 1):
+        needs_layout = layout is None or page in layout
+        if shards:
+            first, last, flag = shards[-1]
+            if flag == needs_layout and last - first + 1 < pages_per_shard:
+                shards[-1] = (first, page, flag)
+                continue
+        shards.append((page, page, needs_layout))
+    return shards
+
 
 class PDFExtractor:
-    def __init__(self):
-        pass
+    """
+    max_workers: partition processes; pages_per_shard: pages per partition call.
+    table_mode: "all" runs table inference / image extraction on every page,
+    "detected" only on pages PyMuPDF flags (see layout_pages); the rest use
+    Unstructured's fast text strategy.
+    """
+
+    def __init__(self, max_workers=EXTRACT_WORKERS, pages_per_shard=EXTRACT_PAGES_PER_SHARD, table_mode=EXTRACT_TABLE_MODE):
+        if table_mode not in ("all", "detected"):
+            raise ValueError(f"Unknown table_mode: {table_mode}")
+        self.max_workers = max(1, max_workers)
+        self.pages_per_shard = max(1, pages_per_shard)
+        self.table_mode = table_mode
+
+    def partition(self, pdf_path):
+        """
+        Unstructured elements of the whole document, in page order.
+
+        The document is split into page-range shards that are partitioned in a
+        process pool; each shard extracts its images into its own folder, so the
+        per-page file names Unstructured picks never collide across shards.
+        """
+        import fitz  # pymupdf
+
+        layout = layout_pages(pdf_path) if self.table_mode == "detected" else None
+        doc_key = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:12]
+        image_root = os.path.join(ASSETS_DIR, "extracted", f"{os.path.basename(pdf_path)}_{doc_key}")
+        # Shard boundaries may differ from the last run; drop that run's images
+        shutil.rmtree(image_root, ignore_errors=True)
+
+        with fitz.open(pdf_path) as doc, tempfile.TemporaryDirectory(prefix="rag_shards_") as shard_dir:
+            shards = plan_shards(len(doc), self.pages_per_shard, layout)
+            if layout is not None:
+                print(f"Layout analysis on {len(layout)} of {len(doc)} pages.")
+
+            jobs = []
+            for first, last, needs_layout in shards:
+                shard_path = os.path.join(shard_dir, f"pages_{first}-{last}.pdf")
+                with fitz.open() as shard:
+                    shard.insert_pdf(doc, from_page=first - 1, to_page=last - 1)
+                    shard.save(shard_path)
+                image_dir = os.path.join(image_root, f"pages_{first}-{last}")
+                jobs.append((shard_path, first, image_dir, needs_layout))
+
+            workers = min(self.max_workers, len(jobs))
+            if workers <= 1:
+                results = [_partition_shard(*job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # map() yields in submission order, i.e. page order
+                    results = list(executor.map(_partition_shard, *zip(*jobs)))
+
+        return [el for elements in results for el in elements]
 
     def extract(self, pdf_path):
         """
         Extracts text and images using Unstructured.
-        Strictly links 'image_path' metadata to Text chunks on the same page.
+        Text/table chunks carry only source + page; each page's images are returned
+        once as an "Image" item and stored in the asset table at indexing time, which
+        serves them for every chunk of that page.
         """
         print(f"Starting Unstructured partition for {pdf_path}...")
+        os.makedirs(ASSETS_DIR, exist_ok=True)
         
-        # 1. Partition PDF (Extract images to ASSETS_DIR)
-        elements = partition_pdf(
-            filename=pdf_path,
-            extract_images_in_pdf=True,
-            extract_image_block_output_dir=ASSETS_DIR,
-            infer_table_structure=True,
-        )
+        # 1. Partition PDF (page shards in parallel; images extracted under ASSETS_DIR)
+        elements = self.partition(pdf_path)
 
-        # 2. Organize Images by Page
+        # 2. Classify by element category: images grouped per page, text kept as chunks
         page_image_map = {}
-        text_elements = []
-
+        final_data = []
         for el in elements:
             page_num = el.metadata.page_number
-            
-            # Identify if it's an Image
-            if "Image" in str(type(el)):
-                # Get path from metadata
+            category = el.category
+
+            if category == "Image":
                 img_path = getattr(el.metadata, "image_path", None)
-                
                 if img_path:
-                    # Unstructured saves absolute paths usually if output_dir is absolute
-                    if page_num not in page_image_map:
-                        page_image_map[page_num] = []
-                    page_image_map[page_num].append(img_path)
-            
-            # Collect Text/Table elements to be chunks
-            if "Text" in str(type(el)) or "Table" in str(type(el)) or "Title" in str(type(el)) or "NarrativeText" in str(type(el)):
-                 # Filter out very short noise
-                 if len(str(el)) > 20: 
-                    text_elements.append({
-                        "content": str(el),
-                        "page": page_num,
-                        "type": str(type(el)).split("'")[1] # Clean type name
+                    page_image_map.setdefault(page_num, []).append(img_path)
+                continue
+
+            if category in TEXT_CATEGORIES:
+                text = str(el)
+                if len(text) > 20:  # Filter out very short noise
+                    final_data.append({
+                        "type": category,
+                        "content": text,
+                        "metadata": {
+                            "source": pdf_path,  # Lets the registry / label index track these chunks
+                            "page": page_num
+                        }
                     })
 
-        # 3. Create Final Data with Linked Metadata
-        final_data = []
-        for item in text_elements:
-            page = item["page"]
-            
-            # Strict Linking: If images exist on this page, add them to metadata
-            linked_images = page_image_map.get(page, [])
-            
-            # The Requirement: "add a metadata key called 'image_path' that contains the local file path"
-            # We will store the LIST of paths.
-            
+        # 3. One image item per page (not vectorised; see src/vectorstore.py)
+        for page_num, paths in sorted(page_image_map.items()):
             final_data.append({
-                "type": item["type"],
-                "content": item["content"],
-                "metadata": {
-                    "page": page,
-                    "image_path": linked_images # Requirement specified 'image_path' key
-                }
+                "type": "Image",
+                "content": "",
+                "image_path": paths,
+                "metadata": {"source": pdf_path, "page": page_num}
             })
-            
+
         return final_data
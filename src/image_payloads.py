@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+from src.config import (
+    IMAGE_PAYLOAD_CACHE_DIR, IMAGE_PAYLOAD_CACHE_MAX_BYTES, IMAGE_PAYLOAD_MEMORY_ITEMS,
+    PROMPT_IMAGE_MAX_DIM, PROMPT_IMAGE_FORMAT, PROMPT_IMAGE_QUALITY
+)
+from src import tracing
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+# Two tiers: base64 strings of recently used images in memory, and the
+# resized/recompressed bytes on disk (survives restarts, LRU-evicted by mtime).
+_lock = threading.Lock()
+_memory = OrderedDict()
+
+
+def _cache_key(image_path, max_dim, image_format, quality):
+    stat = os.stat(image_path)
+    raw = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}|{max_dim}|{image_format}|{quality}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _encode(image_path, max_dim, image_format, quality):
+    with Image.open(image_path) as img:
+        img.thumbnail((max_dim, max_dim))  # Keeps aspect ratio, never upscales
+        if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = BytesIO()
+        img.save(buffer, format=image_format, quality=quality)
+        return buffer.getvalue()
+
+
+def _evict_disk(max_bytes):
+    entries = [e for e in os.scandir(IMAGE_PAYLOAD_CACHE_DIR) if e.is_file()]
+    total = sum(e.stat().st_size for e in entries)
+    if total <= max_bytes:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            total -= size
+        except OSError:
+            continue
+
+
+def get_image_payload(image_path, max_dim=PROMPT_IMAGE_MAX_DIM, image_format=PROMPT_IMAGE_FORMAT, quality=PROMPT_IMAGE_QUALITY):
+    """
+    Returns (mime_type, base64_data) for an image, downscaled to `max_dim` and
+    recompressed. Keyed by path + mtime + size, so an edited file is re-encoded.
+    """
+    image_format = image_format.upper()
+    mime_type = MIME_TYPES[image_format]
+    key = _cache_key(image_path, max_dim, image_format, quality)
+
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            tracing.count("image_payload.memory_hits")
+            return mime_type, _memory[key]
+
+    cached_path = os.path.join(IMAGE_PAYLOAD_CACHE_DIR, f"{key}.{EXTENSIONS[image_format]}")
+    if os.path.exists(cached_path):
+        with open(cached_path, "rb") as f:
+            data = f.read()
+        try:
+            os.utime(cached_path)  # Mark as recently used
+        except OSError:
+            pass
+    else:
+        with tracing.span("image.encode"):
+            data = _encode(image_path, max_dim, image_format, quality)
+        os.makedirs(IMAGE_PAYLOAD_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cached_path)
+        _evict_disk(IMAGE_PAYLOAD_CACHE_MAX_BYTES)
+
+    with tracing.span("image.base64"):
+        encoded = base64.b64encode(data).decode('utf-8')
+    with _lock:
+        _memory[key] = encoded
+        while len(_memory) > IMAGE_PAYLOAD_MEMORY_ITEMS:
+            _memory.popitem(last=False)
+    return mime_type, encoded
+
+
+def image_content_part(image_path):
+    """
+    LangChain image_url content part for an image (data URL with the right MIME type).
+    """
+    mime_type, data = get_image_payload(image_path)
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:{mime_type};base64,{data}"}
+    }
@@ -0,0 +1,301 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from src.config import JOB_DB_PATH, JOB_WORKERS, JOB_POLL_INTERVAL, COLLECTION_NAME
+
+# Job states. Active jobs are queued or running; the rest are final.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+_COLUMNS = ("job_id", "source", "mode", "collection", "status", "pages_done", "total_pages",
+            "pages_indexed", "error", "cancel_requested", "created_at", "updated_at")
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside an ingestion run when its job was cancelled.
+    """
+
+
+class JobStore:
+    """
+    Persistent (SQLite) status of ingestion jobs, so progress survives a browser
+    refresh and interrupted jobs can be picked up again after a restart.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                total_pages INTEGER,
+                pages_indexed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+            """
+        )
+        self._conn.commit()
+
+    def _row(self, row):
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def jobs(self, limit=20):
+        """
+        Most recent jobs first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def active_jobs(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATES
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def submit(self, source, mode="fast", collection=COLLECTION_NAME):
+        """
+        Queues a job and returns its ID. A source that already has an active job
+        in the collection returns that job instead of queueing a duplicate.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE source = ? AND collection = ? AND status IN (?, ?)",
+                (source, collection) + ACTIVE_STATES
+            ).fetchone()
+            if row:
+                return row[0]
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, source, mode, collection, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source, mode, collection, QUEUED, now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim_next(self):
+        """
+        Marks the oldest queued job as running and returns it (None if nothing is queued).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._row(row)
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE job_id = ?",
+                (RUNNING, time.time(), job["job_id"])
+            )
+            self._conn.commit()
+        job["status"] = RUNNING
+        return job
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?", tuple(fields.values()) + (job_id,)
+            )
+            self._conn.commit()
+
+    def request_cancel(self, job_id):
+        """
+        Queued jobs are cancelled right away; running jobs stop at the next page.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ? AND status = ?",
+                (now, job_id, RUNNING)
+            )
+            self._conn.commit()
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def requeue_interrupted(self):
+        """
+        Jobs left 'running' by a process that died go back to the queue.
+        Returns how many were requeued.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 0, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def resume(self, job_id):
+        """
+        Puts a failed or cancelled job back in the queue.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 0, error = NULL, updated_at = ? WHERE job_id = ? AND status IN (?, ?)",
+                (QUEUED, time.time(), job_id, FAILED, CANCELLED)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_ingestion(job, on_progress, should_cancel):
+    """
+    Default job runner: fast-mode ingestion into the job's collection.
+    Resuming needs no extra state: pages that reached the registry before the job
+    stopped hash the same and are skipped (see src/registry.py).
+    """
+    # Imported here so the queue module stays light (resources pulls in Chroma and torch)
+    from src.resources import get_vectorstore, get_registry, get_indexes
+    from src.visual_processor import process_and_index_pdf
+
+    if job["mode"] != "fast":
+        raise ValueError(f"Unsupported ingestion mode: {job['mode']}")
+    collection = job["collection"]
+    return process_and_index_pdf(
+        job["source"],
+        get_vectorstore(collection),
+        get_registry(collection),
+        get_indexes(collection),
+        on_progress=on_progress,
+        should_cancel=should_cancel
+    )
+
+
+class JobQueue:
+    """
+    Runs ingestion jobs on background worker threads of the server process, so
+    uploads don't block a Streamlit session and survive a browser refresh.
+
+    Workers share the process-wide vector store and side indexes (src/resources.py),
+    and jobs of the same collection run one at a time. With PRERENDER_PAGES set,
+    page rendering fans out to a process pool inside the ingestion run.
+
+    runner(job, on_progress, should_cancel) -> pages indexed can be swapped in tests.
+    """
+
+    def __init__(self, store=None, workers=JOB_WORKERS, runner=run_ingestion, poll_interval=JOB_POLL_INTERVAL):
+        self.store = store or JobStore()
+        self.workers = max(1, workers)
+        self.runner = runner
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._collection_locks = {}
+        self._locks_guard = threading.Lock()
+
+    def start(self):
+        """
+        Requeues jobs interrupted by a previous process and starts the workers.
+        """
+        if self._threads:
+            return
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"Resuming {requeued} interrupted ingestion job(s).")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, source, mode="fast", collection=COLLECTION_NAME):
+        job_id = self.store.submit(source, mode, collection)
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id):
+        self.store.request_cancel(job_id)
+
+    def resume(self, job_id):
+        self.store.resume(job_id)
+        self._wake.set()
+
+    def _collection_lock(self, collection):
+        with self._locks_guard:
+            return self._collection_locks.setdefault(collection, threading.Lock())
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.store.claim_next()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            with self._collection_lock(job["collection"]):
+                self._run(job)
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        print(f"Ingestion job {job_id} started: {job['source']}")
+
+        def on_progress(pages_done, total_pages):
+            self.store.update(job_id, pages_done=pages_done, total_pages=total_pages)
+
+        def should_cancel():
+            return self._stop.is_set() or self.store.cancel_requested(job_id)
+
+        try:
+            indexed = self.runner(job, on_progress, should_cancel)
+        except JobCancelled:
+            # A stopping queue leaves the job running so the next start requeues it
+            if not self._stop.is_set():
+                self.store.update(job_id, status=CANCELLED, cancel_requested=0)
+            print(f"Ingestion job {job_id} cancelled.")
+        except Exception as e:
+            traceback.print_exc()
+            self.store.update(job_id, status=FAILED, error=str(e))
+        else:
+            self.store.update(job_id, status=DONE, pages_indexed=indexed or 0)
+            print(f"Ingestion job {job_id} done: {indexed} pages indexed.")
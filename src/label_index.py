@@ -0,0 +1,131 @@
+import os
+import re
+import sqlite3
+import threading
+from src.config import CHROMA_DB_DIR, COLLECTION_NAME
+
+# "Figure 3", "Fig. 3b", "Table 1", "Chart 2" ...
+LABEL_RE = re.compile(r"\b(figure|fig\.?|table|tab\.|chart)\s*(\d+[a-z]?)\b", re.IGNORECASE)
+_KINDS = {"figure": "figure", "fig": "figure", "fig.": "figure", "table": "table", "tab.": "table", "chart": "chart"}
+
+
+def normalize_label(kind, number):
+    return f"{_KINDS[kind.lower()]} {number.lower()}"
+
+
+def find_labels(text):
+    """
+    Normalized labels mentioned in a text ("Describe Fig. 3" -> ["figure 3"]), in order.
+    """
+    labels = []
+    for match in LABEL_RE.finditer(text):
+        label = normalize_label(match.group(1), match.group(2))
+        if label not in labels:
+            labels.append(label)
+    return labels
+
+
+def caption_label(text):
+    """
+    The label a caption starts with ("Figure 1: A Blue Box" -> "figure 1"), else None.
+    """
+    match = LABEL_RE.match(text.strip())
+    if match is None:
+        return None
+    return normalize_label(match.group(1), match.group(2))
+
+
+def labels_from_text(text):
+    """
+    Label entries for text without layout (vision descriptions, extractor elements):
+    lines starting with a label count as captions, other mentions as references.
+    Returns [(label, is_caption, bbox, region)].
+    """
+    entries = {}
+    for line in text.splitlines():
+        label = caption_label(line)
+        if label:
+            entries[label] = True
+    for label in find_labels(text):
+        entries.setdefault(label, False)
+    return [(label, is_caption, None, None) for label, is_caption in entries.items()]
+
+
+def _bbox_str(bbox):
+    return ",".join(f"{v:.1f}" for v in bbox) if bbox else None
+
+
+class LabelIndex:
+    """
+    Figure/Table/Chart label -> (document, page, caption bbox, image region).
+    Lets "Describe Figure 3" resolve by direct lookup instead of semantic search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                label TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                is_caption INTEGER NOT NULL,
+                bbox TEXT,
+                region TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_labels_label ON labels(label);
+            CREATE INDEX IF NOT EXISTS idx_labels_page ON labels(doc_id, page);
+            """
+        )
+        self._conn.commit()
+
+    def replace_page(self, doc_id, source, page, entries):
+        """
+        entries: [(label, is_caption, bbox, region)] - replaces what was stored for the page.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM labels WHERE doc_id = ? AND page = ?", (doc_id, page))
+            self._conn.executemany(
+                "INSERT INTO labels (label, doc_id, source, page, is_caption, bbox, region) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(label, doc_id, source, page, int(is_caption), _bbox_str(bbox), _bbox_str(region))
+                 for label, is_caption, bbox, region in entries]
+            )
+            self._conn.commit()
+
+    def remove_pages(self, doc_id, pages):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM labels WHERE doc_id = ? AND page = ?", [(doc_id, p) for p in pages]
+            )
+            self._conn.commit()
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM labels WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def lookup(self, label):
+        """
+        Pages for a label, captions first (the figure itself) then plain mentions.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, page, is_caption, bbox, region FROM labels WHERE label = ? ORDER BY is_caption DESC, rowid",
+                (label,)
+            ).fetchall()
+        return [{"label": label, "source": r[0], "page": r[1], "is_caption": bool(r[2]),
+                 "bbox": r[3], "region": r[4]} for r in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM labels")
+            self._conn.commit()
+
+
+def label_index_path(collection_name=COLLECTION_NAME):
+    # Next to chroma_db, like the registry and the BM25 index
+    return os.path.join(CHROMA_DB_DIR, f"labels_{collection_name}.sqlite")
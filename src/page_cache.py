@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+from src.config import PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES, RENDER_ZOOM
+from src import tracing
+
+# Size-bounded on-disk LRU cache of rendered PDF pages.
+# A file's mtime doubles as its "last used" stamp: hits touch it, eviction
+# removes the oldest files first until the cache is back under budget.
+_lock = threading.Lock()
+_total_bytes = None
+
+
+def cache_path(pdf_path, page_number, zoom=RENDER_ZOOM, clip=None):
+    """
+    Deterministic cache location for a page (or page region) render.
+    The source file's mtime is part of the key, so replacing a PDF never serves stale pages.
+    """
+    pdf_path = os.path.abspath(pdf_path)
+    stamp = os.path.getmtime(pdf_path)
+    region = ",".join(f"{v:.1f}" for v in clip) if clip else "page"
+    key = hashlib.sha1(f"{pdf_path}|{stamp}|{page_number}|{zoom}|{region}".encode("utf-8")).hexdigest()
+    return os.path.join(PAGE_CACHE_DIR, f"{key}.png")
+
+
+def _scan_total_bytes():
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    total = 0
+    for entry in os.scandir(PAGE_CACHE_DIR):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def _evict(max_bytes):
+    global _total_bytes
+    if _total_bytes <= max_bytes:
+        return
+    entries = [e for e in os.scandir(PAGE_CACHE_DIR) if e.is_file()]
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries:
+        if _total_bytes <= max_bytes:
+            break
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            _total_bytes -= size
+        except OSError:
+            # File in use (e.g. being served by Streamlit) - try the next one
+            continue
+
+
+def register(image_path, max_bytes=PAGE_CACHE_MAX_BYTES):
+    """
+    Accounts for a file written into the cache by another process and evicts if needed.
+    """
+    global _total_bytes
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_total_bytes()
+        else:
+            _total_bytes += os.path.getsize(image_path)
+        _evict(max_bytes)
+
+
+def get_page_image(pdf_path, page_number, zoom=RENDER_ZOOM, clip=None):
+    """
+    Returns the path of a rendered page image (or of the `clip` region of the page),
+    rendering it on first use. Returns None if the source PDF is no longer available.
+    """
+    if not pdf_path or not os.path.exists(pdf_path):
+        return None
+
+    image_path = cache_path(pdf_path, page_number, zoom, clip)
+    if os.path.exists(image_path):
+        try:
+            os.utime(image_path)  # Mark as recently used
+        except OSError:
+            pass
+        tracing.count("page_cache.hits")
+        return image_path
+
+    with tracing.span("render.page", crop=clip is not None):
+        render_to_cache(pdf_path, page_number, image_path, zoom, clip)
+    register(image_path)
+    return image_path
+
+
+def render_to_cache(pdf_path, page_number, image_path, zoom=RENDER_ZOOM, clip=None):
+    """
+    Renders a page into the cache at `image_path`. Safe to run in a worker process;
+    the caller registers the returned path.
+    """
+    from src.page_renderer import render_page
+
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    # Render to a temp name so concurrent readers never see a partial PNG
+    tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+    render_page(pdf_path, page_number, tmp_path, zoom, clip)
+    os.replace(tmp_path, image_path)
+    return image_path
+
+
+def clear():
+    """
+    Removes every cached page image.
+    """
+    global _total_bytes
+    with _lock:
+        if not os.path.isdir(PAGE_CACHE_DIR):
+            return
+        for entry in os.scandir(PAGE_CACHE_DIR):
+            if entry.is_file():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        _total_bytes = None
@@ -0,0 +1,59 @@
+import os
+import threading
+import fitz  # pymupdf
+
+# Kept deliberately light (no streamlit / langchain imports): worker processes
+# import this module on spawn, so anything heavy here is paid once per worker.
+
+# Documents opened by this process, so consecutive pages of the same PDF
+# do not re-parse the file. Keyed by path, mtime and size: a PDF replaced at the
+# same path is reopened (and the old handle closed) instead of rendering stale pages.
+_open_docs = {}  # path -> ((mtime_ns, size), doc)
+_MAX_OPEN_DOCS = 4
+_lock = threading.Lock()
+
+
+def _get_doc(pdf_path):
+    # Caller holds _lock
+    pdf_path = os.path.abspath(pdf_path)
+    stat = os.stat(pdf_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    entry = _open_docs.pop(pdf_path, None)
+    if entry is not None and entry[0] != stamp:
+        entry[1].close()
+        entry = None
+    if entry is None:
+        if len(_open_docs) >= _MAX_OPEN_DOCS:
+            oldest = next(iter(_open_docs))
+            _open_docs.pop(oldest)[1].close()
+        entry = (stamp, fitz.open(pdf_path))
+    _open_docs[pdf_path] = entry  # Re-inserted last: most recently used
+    return entry[1]
+
+
+def close_documents():
+    """
+    Closes every cached document handle (releases the file locks on Windows).
+    """
+    with _lock:
+        for _, doc in _open_docs.values():
+            doc.close()
+        _open_docs.clear()
+
+
+def page_count(pdf_path):
+    with _lock:
+        return len(_get_doc(pdf_path))
+
+
+def render_page(pdf_path, page_number, image_path, zoom=2, clip=None):
+    """
+    Renders a single page (1-based) of a PDF to a PNG file.
+    clip: optional (x0, y0, x1, y1) in PDF points to render only a region (figure crops).
+    Runs in a worker process; only the output path is sent back.
+    """
+    with _lock:
+        page = _get_doc(pdf_path)[page_number - 1]
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=fitz.Rect(clip) if clip else None)
+    pix.save(image_path)
+    return image_path
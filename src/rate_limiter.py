@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket limiter on requests per minute and (optionally)
+    tokens per minute. Both buckets refill continuously; acquire() blocks until
+    both have enough capacity for the call.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None, clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute) if tokens_per_minute else None
+        self._last = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._last
+        self._last = now
+        self._request_budget = min(
+            float(self.requests_per_minute),
+            self._request_budget + elapsed * self.requests_per_minute / 60.0
+        )
+        if self._token_budget is not None:
+            self._token_budget = min(
+                float(self.tokens_per_minute),
+                self._token_budget + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _wait_time(self, tokens):
+        wait = 0.0
+        if self._request_budget < 1:
+            wait = (1 - self._request_budget) * 60.0 / self.requests_per_minute
+        if self._token_budget is not None:
+            # A single call larger than the whole bucket can never fit; let it through when full
+            tokens = min(tokens, self.tokens_per_minute)
+            if self._token_budget < tokens:
+                wait = max(wait, (tokens - self._token_budget) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request (and `tokens` tokens) can be spent, then spends them.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    self._request_budget -= 1
+                    if self._token_budget is not None:
+                        self._token_budget -= min(tokens, self.tokens_per_minute)
+                    return
+            self._sleep(wait)
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from src.config import CHROMA_DB_DIR, COLLECTION_NAME
+from src.label_index import labels_from_text
+from src.asset_table import build_page_assets, near_regions, parse_bbox
+from src import tracing
+
+# Bump when the way pages are turned into chunks changes, so existing pages re-index.
+INGEST_VERSION = "3"  # 3: chunks reference images by page + metadata["image_regions"]
+
+
+def file_fingerprint(path, block_size=1024 * 1024):
+    """
+    sha256 of a file's bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_fingerprint(*parts):
+    """
+    sha256 over the parts that determine what a page indexes to (text, mode, ...).
+    """
+    digest = hashlib.sha256(INGEST_VERSION.encode("utf-8"))
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ingest_signature(*settings):
+    """
+    What a whole document was indexed with: INGEST_VERSION plus the mode's settings
+    (chunk size, ...). Stored with the document; an unchanged file is only skipped
+    when its signature matches too.
+    """
+    return "|".join(str(part) for part in (INGEST_VERSION, *settings))
+
+
+def is_outdated(document):
+    """
+    True if a registry document was indexed before the current INGEST_VERSION
+    (its chunks lack what newer versions add, e.g. image_regions) and needs re-ingesting.
+    """
+    signature = document.get("signature")
+    return not signature or signature.split("|", 1)[0] != INGEST_VERSION
+
+
+def document_id(source):
+    """
+    Stable identifier for a source file (normalized absolute path).
+    """
+    return os.path.normcase(os.path.abspath(source))
+
+
+def chunk_id(doc_id, page, index):
+    """
+    Deterministic vector store ID for the index-th chunk of a page.
+    """
+    prefix = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}:{page}:{index}"
+
+
+class DocumentRegistry:
+    """
+    Tracks which documents/pages are in a collection, their fingerprints and the
+    vector store IDs they were indexed under, so ingestion can skip unchanged pages
+    and delete stale chunks by ID.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                mode TEXT,
+                page_count INTEGER,
+                updated_at REAL NOT NULL,
+                signature TEXT,
+                partial INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                doc_id TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                page_hash TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                PRIMARY KEY (doc_id, page)
+            );
+            """
+        )
+        # Tables created before documents stored their ingest signature / partial flag
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "signature" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN signature TEXT")
+        if "partial" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN partial INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def get_document(self, doc_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, file_hash, mode, page_count, updated_at, signature, partial FROM documents WHERE doc_id = ?",
+                (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"doc_id": doc_id, "source": row[0], "file_hash": row[1], "mode": row[2],
+                "page_count": row[3], "updated_at": row[4], "signature": row[5], "partial": bool(row[6])}
+
+    def documents(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, source, file_hash, mode, page_count, updated_at, signature, partial "
+                "FROM documents ORDER BY source"
+            ).fetchall()
+        return [{"doc_id": r[0], "source": r[1], "file_hash": r[2], "mode": r[3],
+                 "page_count": r[4], "updated_at": r[5], "signature": r[6], "partial": bool(r[7])} for r in rows]
+
+    def page_hashes(self, doc_id):
+        """
+        {page: (page_hash, chunk_ids)} for every indexed page of a document.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, page_hash, chunk_ids FROM pages WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return {page: (page_hash, json.loads(ids)) for page, page_hash, ids in rows}
+
+    def chunk_ids(self):
+        """
+        Every chunk ID recorded for the collection.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_ids FROM pages").fetchall()
+        return [cid for (ids,) in rows for cid in json.loads(ids)]
+
+    def record_pages(self, doc_id, entries):
+        """
+        entries: iterable of (page, page_hash, chunk_ids)
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (doc_id, page, page_hash, chunk_ids) VALUES (?, ?, ?, ?)",
+                [(doc_id, page, page_hash, json.dumps(ids)) for page, page_hash, ids in entries]
+            )
+            self._conn.commit()
+
+    def remove_pages(self, doc_id, pages):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM pages WHERE doc_id = ? AND page = ?", [(doc_id, p) for p in pages]
+            )
+            self._conn.commit()
+
+    def record_document(self, doc_id, source, file_hash, page_count, mode=None, signature=None, partial=False):
+        """
+        partial=True registers a document whose ingestion is still running (or was
+        cancelled / failed) once its first pages are written, so they stay listed
+        and removable; finalize_document records it complete.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, source, file_hash, mode, page_count, updated_at, signature, partial) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, source, file_hash, mode, page_count, time.time(), signature, int(partial))
+            )
+            self._conn.commit()
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def registry_path(collection_name=COLLECTION_NAME):
+    # Lives next to the Chroma files so removing CHROMA_DB_DIR also forgets what was indexed
+    return os.path.join(CHROMA_DB_DIR, f"registry_{collection_name}.sqlite")
+
+
+@dataclass
+class CollectionIndexes:
+    """
+    Side indexes kept in step with a collection's vector store. Any may be None.
+    """
+    lexical: object = None  # BM25Index (src/bm25_index.py)
+    labels: object = None   # LabelIndex (src/label_index.py)
+    assets: object = None   # AssetTable (src/asset_table.py)
+    answers: object = None  # AnswerCache (src/answer_cache.py) - invalidated on re-ingest
+
+
+def sync_pages(vectorstore, registry, doc_id, pages, indexes=None):
+    """
+    Writes new/changed pages of one document to the vector store and side indexes.
+
+    pages: iterable of (page, page_hash, [Documents]) or (page, page_hash, [Documents], page_info).
+    Only pages whose hash differs from the registry are written; old chunks of a
+    rewritten page are deleted by ID. page_info may carry layout-aware extras:
+    - "labels": [(label, is_caption, bbox, region)] (otherwise the text is scanned for captions)
+    - "regions": [bbox] figure regions for the asset table
+    - "images": [path] image files (extracted images, rendered pages) for the asset table
+    Chunks near figure regions get metadata["image_regions"] (region indices); image
+    files are shared by the whole page (see src/asset_table.py). Returns the number of pages written.
+    """
+    indexes = indexes or CollectionIndexes()
+    known = registry.page_hashes(doc_id)
+    stale_ids = []
+    docs_to_add = []
+    ids_to_add = []
+    entries = []
+    written_pages = []
+
+    for item in pages:
+        page, page_hash, docs = item[:3]
+        page_info = item[3] if len(item) > 3 else {}
+        previous = known.get(page)
+        if previous and previous[0] == page_hash:
+            continue
+        if previous:
+            stale_ids.extend(previous[1])
+        assets = []
+        if indexes.assets is not None and docs:
+            source = docs[0].metadata.get("source", doc_id)
+            assets = build_page_assets(
+                doc_id, source, page, page_info.get("regions", []), page_info.get("images", [])
+            )
+            for doc in docs:
+                regions = near_regions(assets, parse_bbox(doc.metadata.get("bbox")))
+                if regions:
+                    doc.metadata["image_regions"] = regions
+        written_pages.append((page, docs, page_info, assets))
+        ids = [chunk_id(doc_id, page, i) for i in range(len(docs))]
+        docs_to_add.extend(docs)
+        ids_to_add.extend(ids)
+        entries.append((page, page_hash, ids))
+
+    if stale_ids:
+        with tracing.span("ingest.vector_delete"):
+            vectorstore.delete(ids=stale_ids)
+        if indexes.lexical is not None:
+            indexes.lexical.remove_many(stale_ids)
+    if docs_to_add:
+        # Embedding happens inside add_documents (nested embed.documents spans)
+        with tracing.span("ingest.vector_upsert", documents=len(docs_to_add)):
+            vectorstore.add_documents(docs_to_add, ids=ids_to_add)
+        if indexes.lexical is not None:
+            with tracing.span("ingest.bm25"):
+                indexes.lexical.add_many(ids_to_add, [d.page_content for d in docs_to_add])
+    tracing.count("ingest.pages_written", len(entries))
+    for page, docs, page_info, assets in written_pages:
+        source = docs[0].metadata.get("source", doc_id)
+        if indexes.labels is not None:
+            labels = page_info.get("labels")
+            if labels is None:
+                labels = labels_from_text("\n".join(d.page_content for d in docs))
+            indexes.labels.replace_page(doc_id, source, page, labels)
+        if indexes.assets is not None:
+            indexes.assets.replace_page(doc_id, source, page, assets)
+    if indexes.answers is not None:
+        for source in {docs[0].metadata.get("source", doc_id) for _, docs, _, _ in written_pages}:
+            indexes.answers.invalidate_source(source)
+    if entries:
+        registry.record_pages(doc_id, entries)
+    return len(entries)
+
+
+def repair_lexical_index(index, registry, vectorstore, batch_size=500):
+    """
+    Re-adds chunks the registry knows but the BM25 index lacks. The index is saved
+    at the end of a document (or on cancel) while pages are recorded at every flush,
+    so a process that died mid-ingest leaves pages a resumed job would skip.
+    Returns the number of chunks added.
+    """
+    missing = [cid for cid in registry.chunk_ids() if cid not in index.doc_lengths]
+    added = 0
+    for offset in range(0, len(missing), batch_size):
+        found = vectorstore.get(ids=missing[offset:offset + batch_size], include=["documents"])
+        index.add_many(found["ids"], found["documents"])
+        added += len(found["ids"])
+    if added:
+        print(f"BM25 index was missing {added} chunk(s); re-added from the vector store.")
+        index.save()
+    return added
+
+
+def finalize_document(vectorstore, registry, doc_id, source, file_hash, page_count, mode=None, indexes=None,
+                      signature=None):
+    """
+    Drops pages that no longer exist (document got shorter), records the document
+    (with its ingest_signature()) and persists the BM25 index.
+    """
+    indexes = indexes or CollectionIndexes()
+    stale_pages = [p for p in registry.page_hashes(doc_id) if p > page_count]
+    if stale_pages:
+        known = registry.page_hashes(doc_id)
+        stale_ids = [cid for p in stale_pages for cid in known[p][1]]
+        if stale_ids:
+            vectorstore.delete(ids=stale_ids)
+            if indexes.lexical is not None:
+                indexes.lexical.remove_many(stale_ids)
+        registry.remove_pages(doc_id, stale_pages)
+        for side_index in (indexes.labels, indexes.assets):
+            if side_index is not None:
+                side_index.remove_pages(doc_id, stale_pages)
+        if indexes.answers is not None:
+            indexes.answers.invalidate_source(source)
+    registry.record_document(doc_id, source, file_hash, page_count, mode, signature)
+    if indexes.lexical is not None:
+        indexes.lexical.save()
+
+
+def remove_document(vectorstore, registry, doc_id, indexes=None):
+    """
+    Deletes every chunk of a document from the vector store, side indexes and registry.
+    """
+    indexes = indexes or CollectionIndexes()
+    ids = [cid for _, ids in registry.page_hashes(doc_id).values() for cid in ids]
+    if ids:
+        vectorstore.delete(ids=ids)
+        if indexes.lexical is not None:
+            indexes.lexical.remove_many(ids)
+            indexes.lexical.save()
+    for side_index in (indexes.labels, indexes.assets):
+        if side_index is not None:
+            side_index.remove_document(doc_id)
+    document = registry.get_document(doc_id)
+    if indexes.answers is not None and document:
+        indexes.answers.invalidate_source(document["source"])
+    registry.remove_document(doc_id)
+
+
+def index_documents(vectorstore, registry, documents, mode=None, indexes=None, page_info=None):
+    """
+    Incrementally indexes already-built Documents (e.g. from the vision indexer),
+    grouped by their 'source' and 'page' metadata. Each source's documents must cover
+    the whole file: pages past the last one given are treated as removed.
+    page_info: optional {(source, page): page_info} passed on to sync_pages.
+    A document may name its page's image file(s) in metadata["image_path"] (a path or
+    a list); they are moved to the page's "images" and stored in the asset table.
+    Documents without a source are added as-is. Returns the number of pages (plus loose documents) written.
+    """
+    page_info = dict(page_info or {})
+    indexes = indexes or CollectionIndexes()
+    by_source = {}
+    loose = []
+    for doc in documents:
+        source = doc.metadata.get("source")
+        if source and doc.metadata.get("page") is not None:
+            by_source.setdefault(source, {}).setdefault(doc.metadata["page"], []).append(doc)
+            images = doc.metadata.pop("image_path", None)
+            if images:
+                info = page_info.setdefault((source, doc.metadata["page"]), {})
+                info["images"] = list(info.get("images", [])) + ([images] if isinstance(images, str) else list(images))
+        else:
+            loose.append(doc)
+
+    written = 0
+    for source, pages in by_source.items():
+        doc_id = document_id(source)
+        page_entries = []
+        for page, docs in sorted(pages.items()):
+            info = page_info.get((source, page), {})
+            page_hash = page_fingerprint(mode, *[d.page_content for d in docs], *info.get("images", []))
+            page_entries.append((page, page_hash, docs, info))
+        written += sync_pages(vectorstore, registry, doc_id, page_entries, indexes)
+        file_hash = file_fingerprint(source) if os.path.exists(source) else ""
+        finalize_document(vectorstore, registry, doc_id, source, file_hash, max(pages), mode, indexes,
+                          signature=ingest_signature(mode))
+
+    if loose:
+        ids = vectorstore.add_documents(loose)
+        if indexes.lexical is not None:
+            indexes.lexical.add_many(ids, [d.page_content for d in loose])
+            indexes.lexical.save()
+        written += len(loose)
+    return written
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from src.config import (
+    RERANK_MODEL_NAME, RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_CACHE_SIZE
+)
+from src import tracing
+
+
+class RerankerUnavailable(Exception):
+    """
+    The cross-encoder could not be loaded (missing package, no network for the
+    download, broken model cache). Raised on every use after the first failure.
+    """
+
+
+class CrossEncoderReranker:
+    """
+    Reorders retrieval candidates by a cross-encoder's (query, passage) relevance score.
+
+    Pairs are scored in batches of `batch_size`; scores are kept in an in-memory LRU
+    keyed by model + query + passage text, so a repeated or refined question only
+    scores passages it has not seen. If scoring the uncached pairs runs past
+    `budget_ms` (checked between batches), the candidates keep their incoming (fused vector/BM25) order; the
+    scores computed so far are still cached for the next call. Model loading is not
+    counted against the budget.
+
+    model can be any object with .predict(pairs) -> scores (stubs work in tests);
+    by default a sentence-transformers CrossEncoder is loaded on first use.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS,
+                 cache_size=RERANK_CACHE_SIZE, model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._model = model
+        self._load_error = None  # A failed load is reported once, not retried per question
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._load_error is not None:
+                raise self._load_error
+            if self._model is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+
+                    print(f"Loading reranker model: {self.model_name}")
+                    with tracing.span("rerank.model_load"):
+                        self._model = CrossEncoder(self.model_name)
+                except Exception as e:
+                    self._load_error = RerankerUnavailable(f"{type(e).__name__}: {e}")
+                    print(f"Reranker unavailable ({self._load_error}); keeping retrieval order.")
+                    raise self._load_error from e
+            return self._model
+
+    def warm_up(self):
+        """
+        Loads the model ahead of the first question (load time is outside the latency budget).
+        Returns False if it is unavailable.
+        """
+        try:
+            self._get_model()
+            return True
+        except RerankerUnavailable:
+            return False
+
+    def _key(self, query, text):
+        return hashlib.sha1(f"{self.model_name}\0{query}\0{text}".encode("utf-8")).digest()
+
+    def scores(self, query, docs):
+        """
+        Relevance score per document, or None if the latency budget ran out first.
+        """
+        keys = [self._key(query, d.page_content) for d in docs]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+        tracing.count("rerank.cache_hits", len(found))
+
+        missing = {}
+        for key, doc in zip(keys, docs):
+            if key not in found and key not in missing:
+                missing[key] = doc.page_content
+        if missing:
+            model = self._get_model()
+            items = list(missing.items())
+            start = time.perf_counter()
+            for offset in range(0, len(items), self.batch_size):
+                if self.budget_ms is not None and (time.perf_counter() - start) * 1000 > self.budget_ms:
+                    tracing.count("rerank.budget_exceeded")
+                    print(f"Reranking exceeded {self.budget_ms} ms; keeping retrieval order.")
+                    return None
+                batch = items[offset:offset + self.batch_size]
+                with tracing.span("rerank.score", pairs=len(batch)):
+                    batch_scores = model.predict([(query, text) for _, text in batch])
+                with self._lock:
+                    for (key, _), score in zip(batch, batch_scores):
+                        found[key] = float(score)
+                        self._cache[key] = float(score)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def rerank(self, query, docs):
+        """
+        docs sorted by cross-encoder score (best first); unchanged if over budget.
+        """
+        if len(docs) < 2:
+            return docs
+        scores = self.scores(query, docs)
+        if scores is None:
+            return docs
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        for i in order:
+            docs[i].metadata["rerank_score"] = round(scores[i], 4)
+        return [docs[i] for i in order]
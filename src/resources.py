@@ -0,0 +1,235 @@
+import threading
+from src.config import CHROMA_DB_DIR, EMBEDDING_MODEL_NAME, COLLECTION_NAME, RERANK_ENABLED
+from src.registry import DocumentRegistry, CollectionIndexes, registry_path, repair_lexical_index
+from src.bm25_index import BM25Index, bm25_path
+from src.label_index import LabelIndex, label_index_path
+from src.asset_table import AssetTable, asset_table_path
+from src.answer_cache import AnswerCache
+from src.job_queue import JobQueue
+from src.reranker import CrossEncoderReranker
+from src import page_cache, tracing
+
+# Process-wide handles. Streamlit re-runs the script on every interaction and
+# every session shares the same interpreter, so keeping these at module level
+# means the embedding model and the Chroma client are loaded once per process.
+# langchain_chroma / langchain_huggingface (torch) / langchain_core are imported on first use, so
+# importing this module stays cheap for the UI's first paint and for workers.
+_lock = threading.RLock()
+_embeddings = None
+_vectorstores = {}
+_registries = {}
+_lexical_indexes = {}
+_label_indexes = {}
+_asset_tables = {}
+_answer_cache = None
+_job_queue = None
+_reranker = None
+_warm_up_thread = None
+_answer_chain = None
+
+
+def get_embeddings():
+    """
+    Returns the shared HuggingFace embedding model, loading it on first use.
+    Wrapped in CachedEmbeddings so texts and queries seen before skip the model.
+    """
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            from src.embedding_cache import CachedEmbeddings
+            print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
+            with tracing.span("embed.model_load"):
+                model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+            _embeddings = CachedEmbeddings(model, namespace=EMBEDDING_MODEL_NAME)
+        return _embeddings
+
+
+def get_vectorstore(collection_name=COLLECTION_NAME):
+    """
+    Returns the shared Chroma handle for a collection, opening it on first use.
+    """
+    with _lock:
+        vectorstore = _vectorstores.get(collection_name)
+        if vectorstore is None:
+            from langchain_chroma import Chroma
+            vectorstore = Chroma(
+                collection_name=collection_name,
+                embedding_function=get_embeddings(),
+                persist_directory=CHROMA_DB_DIR
+            )
+            _vectorstores[collection_name] = vectorstore
+        return vectorstore
+
+
+def get_registry(collection_name=COLLECTION_NAME):
+    """
+    Returns the shared document registry (see src/registry.py) for a collection.
+    """
+    with _lock:
+        registry = _registries.get(collection_name)
+        if registry is None:
+            registry = DocumentRegistry(registry_path(collection_name))
+            _registries[collection_name] = registry
+        return registry
+
+
+def get_lexical_index(collection_name=COLLECTION_NAME):
+    """
+    Returns the shared BM25 index (see src/bm25_index.py) for a collection, loading it from disk on first use.
+    Chunks recorded in the registry after the last save (interrupted ingestion) are re-added on load.
+    """
+    with _lock:
+        index = _lexical_indexes.get(collection_name)
+        if index is None:
+            index = BM25Index.load(bm25_path(collection_name))
+            with tracing.span("bm25.repair"):
+                repair_lexical_index(index, get_registry(collection_name), get_vectorstore(collection_name))
+            _lexical_indexes[collection_name] = index
+        return index
+
+
+def get_label_index(collection_name=COLLECTION_NAME):
+    """
+    Returns the shared Figure/Table label index (see src/label_index.py) for a collection.
+    """
+    with _lock:
+        index = _label_indexes.get(collection_name)
+        if index is None:
+            index = LabelIndex(label_index_path(collection_name))
+            _label_indexes[collection_name] = index
+        return index
+
+
+def get_asset_table(collection_name=COLLECTION_NAME):
+    """
+    Returns the shared per-page asset table (see src/asset_table.py) for a collection.
+    """
+    with _lock:
+        table = _asset_tables.get(collection_name)
+        if table is None:
+            table = AssetTable(asset_table_path(collection_name))
+            _asset_tables[collection_name] = table
+        return table
+
+
+def get_answer_cache():
+    """
+    Returns the shared semantic answer cache (see src/answer_cache.py).
+    """
+    global _answer_cache
+    with _lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+
+def get_reranker():
+    """
+    Returns the shared cross-encoder reranker (see src/reranker.py); the model loads on first rerank.
+    """
+    global _reranker
+    with _lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker()
+        return _reranker
+
+
+def get_job_queue():
+    """
+    Returns the background ingestion queue (see src/job_queue.py), starting its workers on first use.
+    """
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+            _job_queue.start()
+        return _job_queue
+
+
+def get_indexes(collection_name=COLLECTION_NAME):
+    """
+    All side indexes of a collection, bundled for the registry sync helpers.
+    """
+    return CollectionIndexes(
+        lexical=get_lexical_index(collection_name),
+        labels=get_label_index(collection_name),
+        assets=get_asset_table(collection_name),
+        answers=get_answer_cache()
+    )
+
+
+def get_cached_answer_chain():
+    """
+    Returns the generation chain (prompt builder | LLM | parser), built once per process.
+    """
+    global _answer_chain
+    with _lock:
+        if _answer_chain is None:
+            # Imported here to avoid a circular import (chain -> resources)
+            from src.chain import get_answer_chain
+            _answer_chain = get_answer_chain()
+        return _answer_chain
+
+
+def warm_up_async(collection_name=COLLECTION_NAME):
+    """
+    Loads the embedding model, the vector store, the generation chain and (if
+    enabled) the reranker on a background thread (once per process), so the UI
+    paints immediately and the first question does not pay for the heavy imports.
+    """
+    global _warm_up_thread
+
+    def warm_up():
+        try:
+            get_vectorstore(collection_name)
+            get_cached_answer_chain()
+            if RERANK_ENABLED:
+                get_reranker().warm_up()
+        except Exception as e:
+            # The first real use reports the error to the user
+            print(f"Warm-up failed: {e}")
+
+    with _lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+
+def invalidate():
+    """
+    Drops cached vector store handles.
+    The embedding model and the generation chain are kept since they do not depend on the collection.
+    """
+    with _lock:
+        _vectorstores.clear()
+
+
+def reset_collection(collection_name=COLLECTION_NAME):
+    """
+    Deletes every document in a collection through the Chroma client and
+    invalidates the cached handles so the next caller gets a fresh collection.
+
+    Going through the client instead of removing CHROMA_DB_DIR avoids the
+    file lock the running process itself holds on the SQLite file (WinError 32).
+    Rendered page images are dropped and the renderer's open PDFs closed, so the
+    cleared source files can be replaced or deleted.
+    """
+    with _lock:
+        vectorstore = get_vectorstore(collection_name)
+        try:
+            vectorstore.delete_collection()
+            get_registry(collection_name).clear()
+            lexical_index = get_lexical_index(collection_name)
+            lexical_index.clear()
+            lexical_index.save()
+            get_label_index(collection_name).clear()
+            get_asset_table(collection_name).clear()
+            get_answer_cache().clear()
+            page_cache.clear()
+            # Imported here: page_renderer pulls in PyMuPDF
+            from src.page_renderer import close_documents
+            close_documents()
+        finally:
+            invalidate()
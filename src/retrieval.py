@@ -0,0 +1,235 @@
+from langchain_core.documents import Document
+from src.config import (
+    COLLECTION_NAME, RETRIEVAL_K, RETRIEVAL_FETCH_K, RRF_K, RERANK_ENABLED, RERANK_CANDIDATES, LABEL_SOURCE_HITS
+)
+from src.resources import get_vectorstore, get_lexical_index, get_label_index, get_reranker
+from src.reranker import RerankerUnavailable
+from src.label_index import LABEL_RE, find_labels
+from src.asset_table import parse_bbox, format_bbox
+from src import tracing
+
+
+def _page_key(doc):
+    source = doc.metadata.get("source")
+    page = doc.metadata.get("page")
+    if source is None or page is None:
+        return None
+    return (source, page)
+
+
+def collapse_to_pages(docs, k=RETRIEVAL_K):
+    """
+    Groups chunk hits by (source, page), ranked by each page's best hit, and
+    merges the hit chunks of a page back into one Document in reading order
+    (their vector store IDs in metadata["chunk_ids"]).
+    Overlap carried between consecutive chunks is dropped when both are present.
+    Documents without source/page (legacy extractor data) are kept as-is.
+    """
+    groups = []
+    by_page = {}
+    for doc in docs:
+        key = _page_key(doc)
+        if key is None:
+            groups.append([doc])
+            continue
+        if key not in by_page:
+            by_page[key] = []
+            groups.append(by_page[key])
+        by_page[key].append(doc)
+
+    pages = []
+    for group in groups[:k]:
+        if len(group) == 1:
+            pages.append(group[0])
+            continue
+
+        chunks = sorted(group, key=lambda d: d.metadata.get("chunk", 0))
+        parts = []
+        previous_index = None
+        for chunk in chunks:
+            text = chunk.page_content
+            index = chunk.metadata.get("chunk", 0)
+            if previous_index is not None and index == previous_index + 1:
+                text = text[chunk.metadata.get("overlap", 0):]
+            parts.append(text)
+            previous_index = index
+
+        # Best-ranked chunk's metadata describes the page; bbox and figure regions cover every hit chunk
+        metadata = dict(group[0].metadata)
+        metadata["chunks"] = len(group)
+        metadata["chunk_ids"] = sorted(c.id for c in group if c.id)
+        regions = sorted({i for c in group for i in c.metadata.get("image_regions") or []})
+        if regions:
+            metadata["image_regions"] = regions
+        boxes = [parse_bbox(c.metadata.get("bbox")) for c in group]
+        boxes = [b for b in boxes if b]
+        if boxes:
+            metadata["bbox"] = format_bbox((
+                min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes)
+            ))
+        pages.append(Document(page_content="\n".join(parts), metadata=metadata))
+    return pages
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """
+    Fuses ranked ID lists: score(id) = sum(1 / (rrf_k + rank)). Returns IDs best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _fetch_documents(vectorstore, ids):
+    """
+    Loads BM25-only hits from the collection by ID.
+    """
+    if not ids:
+        return {}
+    found = vectorstore.get(ids=ids, include=["documents", "metadatas"])
+    return {
+        doc_id: Document(id=doc_id, page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+
+
+def hybrid_search(question, fetch_k=RETRIEVAL_FETCH_K, collection_name=COLLECTION_NAME):
+    """
+    Vector similarity and BM25 hits fused with reciprocal rank fusion (chunk level).
+    Exact tokens like "Figure 3" or "Table 1" that embeddings blur are caught by BM25.
+    """
+    vectorstore = get_vectorstore(collection_name)
+    with tracing.span("query.vector_search"):
+        vector_hits = vectorstore.similarity_search(question, k=fetch_k)
+    with tracing.span("query.bm25_search"):
+        lexical_hits = get_lexical_index(collection_name).search(question, k=fetch_k)
+
+    docs_by_id = {doc.id: doc for doc in vector_hits if doc.id}
+    vector_ranking = [doc.id for doc in vector_hits if doc.id]
+    lexical_ranking = [doc_id for doc_id, _ in lexical_hits]
+    with tracing.span("query.fetch_lexical_hits"):
+        docs_by_id.update(_fetch_documents(
+            vectorstore, [doc_id for doc_id in lexical_ranking if doc_id not in docs_by_id]
+        ))
+
+    fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+    # Vector hits without an ID (very old collections) keep their original order at the end
+    return [docs_by_id[doc_id] for doc_id in fused if doc_id in docs_by_id] + \
+        [doc for doc in vector_hits if not doc.id]
+
+
+def _page_documents(vectorstore, source, page):
+    """
+    All chunks stored for one page, as Documents.
+    """
+    found = vectorstore.get(
+        where={"$and": [{"source": source}, {"page": page}]},
+        include=["documents", "metadatas"]
+    )
+    return [
+        Document(id=doc_id, page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    ]
+
+
+def _best_hit_source(entries, hits):
+    """
+    Source of the labelled page in `entries` that ranks highest among `hits`, or None.
+    """
+    labelled = {(entry["source"], entry["page"]) for entry in entries}
+    for doc in hits:
+        key = _page_key(doc)
+        if key in labelled:
+            return key[0]
+    return None
+
+
+def label_lookup(question, k=RETRIEVAL_K, collection_name=COLLECTION_NAME):
+    """
+    Resolves questions naming a Figure/Table/Chart label through the label index
+    (src/label_index.py). Returns the labelled pages (captions preferred over plain
+    mentions), or [] when the question names no known label.
+
+    When the label exists in several documents ("Figure 1" of every paper), the rest
+    of the question (labels removed, since they match every labelled page) is searched
+    and the document whose labelled page ranks highest in its top LABEL_SOURCE_HITS
+    hits is kept. If none of the labelled pages is among them ("Describe Figure 1"),
+    the question is left to normal retrieval ([] is returned).
+    """
+    labels = find_labels(question)
+    if not labels:
+        return []
+
+    label_index = get_label_index(collection_name)
+    entries = []
+    seen = set()
+    for label in labels:
+        matches = label_index.lookup(label)
+        captions = [m for m in matches if m["is_caption"]] or matches
+        for entry in captions:
+            key = (entry["source"], entry["page"])
+            if key not in seen:
+                seen.add(key)
+                entries.append(entry)
+    if not entries:
+        return []
+
+    sources = {entry["source"] for entry in entries}
+    if len(sources) > 1:
+        rest = LABEL_RE.sub(" ", question).strip()
+        hits = hybrid_search(rest, fetch_k=LABEL_SOURCE_HITS, collection_name=collection_name) if rest else []
+        source = _best_hit_source(entries, hits[:LABEL_SOURCE_HITS])
+        if source is None:
+            tracing.count("query.label_ambiguous")
+            return []
+        entries = [entry for entry in entries if entry["source"] == source]
+
+    vectorstore = get_vectorstore(collection_name)
+    pages = []
+    for entry in entries[:k]:
+        chunks = _page_documents(vectorstore, entry["source"], entry["page"])
+        if not chunks:
+            continue
+        page_doc = collapse_to_pages(chunks, 1)[0]
+        page_doc.metadata["label"] = entry["label"]
+        if entry["region"]:
+            page_doc.metadata["label_region"] = entry["region"]
+        pages.append(page_doc)
+    return pages
+
+
+def rerank(question, docs):
+    """
+    Cross-encoder rerank of chunk hits (see src/reranker.py). Falls back to the
+    incoming order if the reranker is unavailable or over its latency budget.
+    """
+    try:
+        with tracing.span("query.rerank", candidates=len(docs)):
+            return get_reranker().rerank(question, docs)
+    except RerankerUnavailable:
+        return docs
+
+
+def retrieve(question, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, collection_name=COLLECTION_NAME, use_rerank=RERANK_ENABLED):
+    """
+    Questions naming a known label ("Describe Figure 3") resolve by direct lookup
+    (see label_lookup for labels found in several documents); everything else goes
+    through hybrid (vector + BM25) chunk search collapsed to the top `k` unique pages.
+    With reranking, a wider candidate set (RERANK_CANDIDATES chunks) is fetched and
+    reordered by a cross-encoder first.
+    """
+    with tracing.span("query.label_lookup"):
+        label_docs = label_lookup(question, k=k, collection_name=collection_name)
+    if label_docs:
+        tracing.count("query.label_hits")
+        return label_docs
+
+    if use_rerank:
+        fetch_k = max(fetch_k, RERANK_CANDIDATES)
+    hits = hybrid_search(question, fetch_k=max(k, fetch_k), collection_name=collection_name)
+    if use_rerank:
+        hits = rerank(question, hits)
+    return collapse_to_pages(hits, k)
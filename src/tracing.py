@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.config import TRACING_ENABLED, TRACE_LOG_PATH, TRACE_LOG_MAX_BYTES, METRICS_PROM_PATH
+
+# Lightweight tracing: named spans (wall time) and counters.
+#
+#   with tracing.trace("question", question=q) as t:   # one per question / ingestion
+#       with tracing.span("query.vector_search"):
+#           ...
+#       t.breakdown()                                 # per-span totals for the UI
+#
+# Spans outside a trace still feed the process-wide metrics, which are exported in
+# Prometheus text format (METRICS_PROM_PATH); finished traces are appended as one
+# JSON line each to TRACE_LOG_PATH.
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+_current_depth = contextvars.ContextVar("rag_span_depth", default=0)
+
+_metrics_lock = threading.Lock()
+_counters = {}  # name -> value
+_timings = {}   # name -> [count, total_seconds, max_seconds]
+_export_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Spans and counters recorded while a trace is active in the current context.
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.seconds = None
+        self.spans = []  # {"name", "start", "seconds", "depth", **attrs}
+        self.counters = {}
+        self._t0 = time.perf_counter()
+
+    def breakdown(self):
+        """
+        [(span name, total seconds, calls, depth)] in first-seen order; nested spans
+        (depth > 0) are included in their parent's time too.
+        """
+        totals = {}
+        for s in self.spans:
+            entry = totals.setdefault(s["name"], [0.0, 0, s["depth"]])
+            entry[0] += s["seconds"]
+            entry[1] += 1
+        return [(name, seconds, calls, depth) for name, (seconds, calls, depth) in totals.items()]
+
+    def to_dict(self):
+        return {
+            "trace": self.name,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "attrs": self.attrs,
+            "spans": self.spans,
+            "counters": self.counters,
+        }
+
+
+def _observe(name, seconds):
+    with _metrics_lock:
+        entry = _timings.get(name)
+        if entry is None:
+            _timings[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+
+def observe(name, seconds, **attrs):
+    """
+    Records a duration measured elsewhere (e.g. a backoff sleep, time to first token).
+    """
+    if not TRACING_ENABLED:
+        return
+    _observe(name, seconds)
+    current = _current_trace.get()
+    if current is not None:
+        current.spans.append({
+            "name": name, "start": round(time.perf_counter() - current._t0 - seconds, 6),
+            "seconds": seconds, "depth": _current_depth.get(), **attrs
+        })
+
+
+def count(name, value=1):
+    """
+    Increments a counter (process-wide and on the active trace).
+    """
+    if not TRACING_ENABLED:
+        return
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + value
+    current = _current_trace.get()
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + value
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block under `name`.
+    """
+    if not TRACING_ENABLED:
+        yield
+        return
+    depth = _current_depth.get()
+    token = _current_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _current_depth.reset(token)
+        _observe(name, seconds)
+        current = _current_trace.get()
+        if current is not None:
+            current.spans.append({
+                "name": name, "start": round(start - current._t0, 6),
+                "seconds": seconds, "depth": depth, **attrs
+            })
+
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    Collects the spans of one operation; exported to the sinks when the block exits.
+    """
+    current = Trace(name, **attrs)
+    if not TRACING_ENABLED:
+        yield current
+        return
+    trace_token = _current_trace.set(current)
+    depth_token = _current_depth.set(0)
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - current._t0
+        _current_depth.reset(depth_token)
+        _current_trace.reset(trace_token)
+        _observe(f"trace.{name}", current.seconds)
+        export(current)
+
+
+def traced(name):
+    """
+    Decorator: runs the function inside trace(name).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def prometheus_text(prefix="rag"):
+    """
+    Process-wide counters and span timings in the Prometheus text exposition format.
+    """
+    with _metrics_lock:
+        counters = dict(_counters)
+        timings = {name: list(v) for name, v in _timings.items()}
+    lines = []
+    if counters:
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(counters.items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+    if timings:
+        lines.append(f"# TYPE {prefix}_span_seconds summary")
+        for name, (calls, total, _) in sorted(timings.items()):
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {calls}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines.append(f"# TYPE {prefix}_span_seconds_max gauge")
+        for name, (_, _, longest) in sorted(timings.items()):
+            lines.append(f'{prefix}_span_seconds_max{{span="{name}"}} {longest:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def export(finished, trace_log_path=TRACE_LOG_PATH, prom_path=METRICS_PROM_PATH):
+    """
+    Appends a finished trace to the JSONL log and rewrites the Prometheus text file.
+    Either sink is skipped when its path is empty; export errors never break the caller.
+    """
+    try:
+        with _export_lock:
+            for path in (trace_log_path, prom_path):
+                if path:
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if trace_log_path:
+                # Keep one rotated file so the log can't grow without bound
+                if os.path.exists(trace_log_path) and os.path.getsize(trace_log_path) > TRACE_LOG_MAX_BYTES:
+                    os.replace(trace_log_path, f"{trace_log_path}.1")
+                with open(trace_log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+            if prom_path:
+                # Atomic replace so a scraper never reads a half-written file
+                tmp_path = f"{prom_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(prometheus_text())
+                os.replace(tmp_path, prom_path)
+    except OSError as e:
+        print(f"Could not export trace {finished.name}: {e}")
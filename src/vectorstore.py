@@ -1,28 +1,19 @@
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-from src.config import CHROMA_DB_DIR
-import shutil
-import os
+from src.config import COLLECTION_NAME
+from src.resources import get_vectorstore, get_registry, get_indexes, reset_collection
+from src.registry import index_documents
 
-def get_retriever(extracted_data=None, documents=None, collection_name="rag_collection", reset=False):
+def get_retriever(extracted_data=None, documents=None, collection_name=COLLECTION_NAME, reset=False):
     """
-    Initializes or loads the vector store with HuggingFace embeddings.
+    Loads the shared vector store (see src/resources.py) and returns a retriever.
     Accepts:
     - extracted_data: List of dicts (Old Extractor)
     - documents: List of LangChain Documents (New Vision Indexer)
     """
-    # Use local embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    if reset:
+        reset_collection(collection_name)
 
-    if reset and os.path.exists(CHROMA_DB_DIR):
-        shutil.rmtree(CHROMA_DB_DIR)
-
-    vectorstore = Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=CHROMA_DB_DIR
-    )
+    vectorstore = get_vectorstore(collection_name)
 
     docs_to_add = []
 
@@ -32,9 +23,16 @@ def get_retriever(extracted_data=None, documents=None, collection_name="rag_coll
         print(f"Queueing {len(documents)} Documents for ingestion.")
 
     # Handle extracted_data dicts (Legacy/Fallback)
+    page_info = {}
     if extracted_data:
-        documents = []
         for item in extracted_data:
+            # Per-page image lists go to the asset table, not the vector store
+            if item.get("type") == "Image" and not item.get("summary"):
+                meta = item.get("metadata", {})
+                key = (meta.get("source"), meta.get("page"))
+                page_info.setdefault(key, {"images": []})["images"].extend(item.get("image_path") or [])
+                continue
+
             # Determine content to vectorise
             # For Text: use 'content'
             # For Table/Image: use 'summary'
@@ -47,8 +45,8 @@ def get_retriever(extracted_data=None, documents=None, collection_name="rag_coll
             metadata = item.get("metadata", {})
             metadata["type"] = item.get("type")
             if item.get("image_path"):
-                # Serialize list to string for ChromaDB compatibility
-                metadata["image_path"] = str(item.get("image_path"))
+                # Moved to the asset table by index_documents
+                metadata["image_path"] = item.get("image_path")
             
             # Store raw content in metadata
             metadata["raw_content"] = item.get("content")[:5000]
@@ -60,7 +58,11 @@ def get_retriever(extracted_data=None, documents=None, collection_name="rag_coll
             docs_to_add.append(doc)
 
     if docs_to_add:
-        vectorstore.add_documents(docs_to_add)
-        print(f"Added {len(docs_to_add)} documents to vector store.")
+        # Pages already indexed with the same content are skipped (see src/registry.py)
+        written = index_documents(
+            vectorstore, get_registry(collection_name), docs_to_add,
+            indexes=get_indexes(collection_name), page_info=page_info
+        )
+        print(f"Indexed {written} new/changed pages ({len(docs_to_add)} documents queued).")
 
     return vectorstore.as_retriever(search_kwargs={"k": 2})
@@ -0,0 +1,170 @@
+import contextvars
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.messages import HumanMessage
+from src.rate_limiter import RateLimiter
+from src.description_cache import description_key
+from src.config import VISION_MAX_CONCURRENCY, VISION_REQUESTS_PER_MINUTE, VISION_TOKENS_PER_MINUTE
+import base64
+from src import tracing
+
+VISION_PROMPT = "Analyze this page image. Describe any diagrams, figures, charts, or tables in detail. If there is a Figure label (e.g., 'Figure 1'), include it explicitly. Summarize the main text visible. This description will be used for retrieval."
+
+# Rough per-request token cost used for the tokens-per-minute bucket:
+# Gemini bills a page image at ~258 tokens, plus the prompt and the description itself.
+IMAGE_TOKENS = 258
+EXPECTED_OUTPUT_TOKENS = 512
+
+
+_vision_limiter = None
+_vision_limiter_lock = threading.Lock()
+
+
+def get_vision_limiter():
+    """
+    Shared process-wide limiter on the vision quota (VISION_REQUESTS_PER_MINUTE /
+    VISION_TOKENS_PER_MINUTE), so back-to-back or concurrent ingestions draw from
+    one bucket instead of each starting with a full minute's worth.
+    """
+    global _vision_limiter
+    with _vision_limiter_lock:
+        if _vision_limiter is None:
+            _vision_limiter = RateLimiter(VISION_REQUESTS_PER_MINUTE, VISION_TOKENS_PER_MINUTE)
+        return _vision_limiter
+
+
+def estimate_tokens(prompt=VISION_PROMPT):
+    return IMAGE_TOKENS + len(prompt) // 4 + EXPECTED_OUTPUT_TOKENS
+
+
+def build_vision_message(image_bytes, prompt=VISION_PROMPT, mime_type="image/png"):
+    """
+    HumanMessage with the page image inlined as base64.
+    """
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    return HumanMessage(
+        content=[
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+        ]
+    )
+
+
+def llm_model_name(llm):
+    """
+    Model identifier used in cache keys ("model" on Gemini clients, "model_name" on others).
+    """
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+
+
+def describe_pages(pages, llm, max_concurrency=VISION_MAX_CONCURRENCY, limiter=None,
+                   prompt=VISION_PROMPT, max_attempts=None, retryable=None,
+                   on_result=None, sleep=time.sleep, cache=None):
+    """
+    Describes page images concurrently.
+
+    pages: iterable of (page_num, image_bytes)
+    llm: anything with .invoke(messages) returning an object with .content (stub LLMs work)
+
+    Keeps up to `max_concurrency` requests in flight, spending one request and an
+    estimated token cost from `limiter` (default: get_vision_limiter()) per call. A retryable error (429 / 5xx) on one
+    page re-queues that page after exponential backoff without holding a worker slot,
+    so other pages keep flowing. Backed-off pages count against `max_concurrency`
+    too: no new page is pulled from `pages` while in-flight plus waiting pages fill
+    the window, so at most that many page images are held in memory even under
+    sustained 429s. Returns {page_num: description}; iterate sorted keys
+    for page order. `on_result(page_num, description)` is called as pages finish.
+
+    With a `cache` (src/description_cache.py), pages whose bytes were already described
+    by the same model and prompt are answered from disk without an API call.
+    """
+    # llm_utils pulls in the Gemini client libraries; imported once pages are actually described
+    from src.llm_utils import RETRYABLE_ERRORS, MAX_ATTEMPTS, backoff_seconds
+    if max_attempts is None:
+        max_attempts = MAX_ATTEMPTS
+    if retryable is None:
+        retryable = RETRYABLE_ERRORS
+    if limiter is None:
+        limiter = get_vision_limiter()
+    tokens = estimate_tokens(prompt)
+    model_name = llm_model_name(llm)
+
+    def describe(page_num, image_bytes):
+        with tracing.span("vision.rate_limit_wait"):
+            limiter.acquire(tokens)
+        with tracing.span("vision.llm"):
+            response = llm.invoke([build_vision_message(image_bytes, prompt)])
+        return response.content
+
+    results = {}
+    page_iter = iter(pages)
+    retry_heap = []  # (ready_at, page_num, attempt, image_bytes)
+    in_flight = {}   # future -> (page_num, attempt, image_bytes)
+    exhausted = False
+
+    def finish(page_num, description):
+        results[page_num] = description
+        if on_result:
+            on_result(page_num, description)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while True:
+            # Fill free slots: due retries first, then fresh pages while the window has room
+            while len(in_flight) < max_concurrency:
+                if retry_heap and retry_heap[0][0] <= time.monotonic():
+                    _, page_num, attempt, image_bytes = heapq.heappop(retry_heap)
+                elif not exhausted and len(in_flight) + len(retry_heap) < max_concurrency:
+                    try:
+                        page_num, image_bytes = next(page_iter)
+                        attempt = 1
+                    except StopIteration:
+                        exhausted = True
+                        continue
+                    if cache is not None:
+                        cached = cache.get(description_key(image_bytes, model_name, prompt))
+                        if cached is not None:
+                            tracing.count("vision.cache_hits")
+                            finish(page_num, cached)
+                            continue
+                else:
+                    break
+                # Run in a copy of this context so the worker's spans join the caller's trace
+                future = executor.submit(contextvars.copy_context().run, describe, page_num, image_bytes)
+                in_flight[future] = (page_num, attempt, image_bytes)
+
+            if not in_flight:
+                if not retry_heap:
+                    break
+                # Only backed-off pages left: sleep until the first is due
+                sleep(max(0.0, retry_heap[0][0] - time.monotonic()))
+                continue
+
+            timeout = None
+            if retry_heap:
+                timeout = max(0.0, retry_heap[0][0] - time.monotonic())
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                page_num, attempt, image_bytes = in_flight.pop(future)
+                try:
+                    description = future.result()
+                    if cache is not None:
+                        cache.put(description_key(image_bytes, model_name, prompt), description, model_name)
+                    finish(page_num, description)
+                except retryable as e:
+                    if attempt >= max_attempts:
+                        print(f"Error describing page {page_num}: {e}")
+                        finish(page_num, f"Visual description unavailable for page {page_num}.")
+                        continue
+                    delay = backoff_seconds(attempt)
+                    tracing.count("vision.retries")
+                    tracing.observe("vision.backoff", delay)
+                    print(f"Rate limit hit on page {page_num}. Retrying in {delay} seconds...")
+                    heapq.heappush(retry_heap, (time.monotonic() + delay, page_num, attempt + 1, image_bytes))
+                except Exception as e:
+                    print(f"Error describing page {page_num}: {e}")
+                    finish(page_num, f"Visual description unavailable for page {page_num}.")
+
+    return results
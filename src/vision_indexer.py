@@ -1,88 +1,106 @@
 import os
-import base64
-from pdf2image import convert_from_path
 from langchain_core.documents import Document
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-from src.config import ASSETS_DIR, GOOGLE_API_KEY
-from src.llm_utils import invoke_with_retry
-
-# Initialize Vision Model (Gemini 3 Flash Preview)
-# Using Gemini 3 as a substitute for the decommissioned Groq Vision model
-vision_llm = ChatGoogleGenerativeAI(
-    model="models/gemini-3-flash-preview", 
-    google_api_key=GOOGLE_API_KEY,
-    temperature=0
-)
-
-def encode_image(image_path):
-    """Helper to convert image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-def process_pdf_with_vision(pdf_path, output_dir=ASSETS_DIR):
+from src.config import ASSETS_DIR, GOOGLE_API_KEY, VISION_MAX_CONCURRENCY, RENDER_ZOOM
+from src.page_renderer import page_count, render_page
+from src.vision_describer import describe_pages, get_vision_limiter
+from src.description_cache import get_description_cache
+from src import tracing
+
+_vision_llm = None
+
+def get_vision_llm():
+    """
+    Vision Model (Gemini 3 Flash Preview), created on first use.
+    Using Gemini 3 as a substitute for the decommissioned Groq Vision model
     """
-    1. Converts PDF pages to images.
-    2. Uses Vision LLM (Gemini 3) to describe them.
-    3. Returns Documents with image_path in metadata.
+    global _vision_llm
+    if _vision_llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _vision_llm = ChatGoogleGenerativeAI(
+            model="models/gemini-3-flash-preview",
+            google_api_key=GOOGLE_API_KEY,
+            temperature=0
+        )
+    return _vision_llm
+
+@tracing.traced("ingest.vision")
+def process_pdf_with_vision(pdf_path, output_dir=ASSETS_DIR, llm=None, max_concurrency=VISION_MAX_CONCURRENCY, limiter=None, cache=None):
+    """
+    1. Renders PDF pages to images one at a time (PyMuPDF).
+    2. Uses Vision LLM (Gemini 3) to describe them, several pages in flight at once
+       under the rate limits in src/config.py (see src/vision_describer.py).
+    3. Returns Documents in page order, naming their page image in metadata["image_path"]
+       (moved to the asset table by index_documents, see src/registry.py).
+
+    Pages are rendered only when the describer has a free slot and the pixmap is
+    dropped once the PNG is written, so memory is bounded by max_concurrency pages
+    rather than the document length, and the first request goes out after one page.
+
+    Descriptions are cached by page content + model + prompt, so re-ingesting a file
+    (or a near-identical copy) only pays for pages that actually changed.
+
+    llm / limiter / cache can be swapped for local stubs in tests.
     """
+    if llm is None:
+        llm = get_vision_llm()
+    if cache is None:
+        cache = get_description_cache()
+    if limiter is None:
+        limiter = get_vision_limiter()
+
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     print(f"Processing Visuals for: {pdf_path}")
-    
+
     try:
-        # Convert PDF to images
-        # Poppler must be in PATH. If on Windows and not in PATH, this might fail.
-        # Users often need to download poppler binaries and add 'bin' to PATH.
-        images = convert_from_path(pdf_path)
+        total_pages = page_count(pdf_path)
     except Exception as e:
-        print(f"Error converting PDF to images: {e}")
-        print("Ensure Poppler is installed and added to PATH.")
+        print(f"Error opening PDF: {e}")
         return []
 
-    documents = []
+    image_paths = {}
 
-    for i, img in enumerate(images):
-        # Save image locally
-        # Use a consistent naming convention
-        image_filename = f"visual_summary_page_{i+1}_{os.path.basename(pdf_path)}.png"
-        image_path = os.path.join(output_dir, image_filename)
-        img.save(image_path, "PNG")
-
-        print(f"Describing Page {i+1}...")
-        
-        # Prepare prompt for the Vision Model
-        base64_image = encode_image(image_path)
-        
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": "Analyze this page image. Describe any diagrams, figures, charts, or tables in detail. If there is a Figure label (e.g., 'Figure 1'), include it explicitly. Summarize the main text visible. This description will be used for retrieval."},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
-            ]
-        )
-        
-        try:
-            # Invoke with retry logic
-            response = invoke_with_retry(vision_llm, [message])
-            description = response.content
-        except Exception as e:
-            print(f"Error describing page {i+1}: {e}")
-            description = f"Visual description unavailable for page {i+1}."
-
-        print(f"Generated Description for Page {i+1}: {description[:50]}...")
-
-        # Create Document with Link to Image
-        # Note: 'image_path' metadata key is critical for the UI to display it
-        # The chain.py also expects 'image_path' list. 
-        # We'll stick to the requested single 'image_path' key but the chain.py logic handles lists/single.
-        
+    def saved_pages():
+        # Pulled lazily by describe_pages: one page is rendered per free request slot
+        for page_num in range(1, total_pages + 1):
+            # Save image locally
+            # Use a consistent naming convention
+            image_filename = f"visual_summary_page_{page_num}_{os.path.basename(pdf_path)}.png"
+            image_path = os.path.join(output_dir, image_filename)
+            try:
+                with tracing.span("ingest.render"):
+                    render_page(pdf_path, page_num, image_path, RENDER_ZOOM)
+            except Exception as e:
+                print(f"Error rendering page {page_num}: {e}")
+                continue
+            image_paths[page_num] = image_path
+
+            with open(image_path, "rb") as image_file:
+                yield page_num, image_file.read()
+
+    def log_description(page_num, description):
+        print(f"Generated Description for Page {page_num}: {description[:50]}...")
+
+    descriptions = describe_pages(
+        saved_pages(),
+        llm,
+        max_concurrency=max_concurrency,
+        limiter=limiter,
+        on_result=log_description,
+        cache=cache
+    )
+    print(f"Description cache: {cache.stats()}")
+
+    documents = []
+    for page_num in sorted(descriptions):
+        # Create Document with Link to Image (stored as an asset reference at indexing)
         doc = Document(
-            page_content=description,  # This is what the retriever searches against
+            page_content=descriptions[page_num],  # This is what the retriever searches against
             metadata={
-                "source": pdf_path, 
-                "page": i+1, 
-                "image_path": image_path  # The UI will pick this up
+                "source": pdf_path,
+                "page": page_num,
+                "image_path": image_paths[page_num]
             }
         )
         documents.append(doc)
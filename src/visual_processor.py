@@ -1,70 +1,362 @@
 import os
 import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain_core.documents import Document
-from src.config import ASSETS_DIR
+from src.config import (
+    RENDER_ZOOM, RENDER_WORKERS, PRERENDER_PAGES, INDEX_BATCH_SIZE, CHUNK_SIZE, CHUNK_OVERLAP,
+    FIGURE_MIN_SIZE, FIGURE_PADDING
+)
+from src import page_cache
+from src.registry import (
+    document_id, file_fingerprint, page_fingerprint, ingest_signature, sync_pages, finalize_document
+)
+from src.label_index import caption_label, find_labels
+from src.job_queue import JobCancelled
+from src import tracing
 import streamlit as st
 
-def process_and_index_pdf(pdf_path, vectorstore):
+def _split_text(text, max_chars):
     """
-    FAST MODE: Converts PDF -> Images -> Extracts Raw Text (PyMuPDF) -> Vector Store.
-    Bypasses Gemini Vision for Speed. 
-    Retrieval links text matches to the visual page image.
+    Splits text on whitespace into pieces of at most max_chars (longer words are cut).
     """
-    if not os.path.exists(ASSETS_DIR):
-        os.makedirs(ASSETS_DIR)
+    pieces = []
+    current = ""
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
 
+def _join_pieces(pieces):
+    # Pieces of the same text block are joined with a space, blocks with a newline
+    text = ""
+    previous_block = None
+    for piece_text, _, block_no in pieces:
+        if text:
+            text += " " if block_no == previous_block else "\n"
+        text += piece_text
+        previous_block = block_no
+    return text
+
+def chunk_page(page, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, blocks=None):
+    """
+    Splits a page into overlapping chunks that follow its text blocks in reading order.
+    Returns a list of (text, bbox, overlap): bbox is the union of the chunk's blocks and
+    overlap the number of leading characters repeated from the previous chunk.
+    """
+    if blocks is None:
+        blocks = page.get_text("blocks", sort=True)
+    pieces = []  # (text, (x0, y0, x1, y1), block_no)
+    for x0, y0, x1, y1, text, block_no, block_type in blocks:
+        if block_type != 0:  # Image block
+            continue
+        text = " ".join(text.split())
+        if not text:
+            continue
+        # Small pieces let the overlap carry whole sentences instead of whole paragraphs
+        for part in _split_text(text, max(1, chunk_overlap)):
+            pieces.append((part, (x0, y0, x1, y1), block_no))
+
+    chunks = []
+    current = []
+    carried = 0
+
+    def emit():
+        text = _join_pieces(current)
+        overlap = len(_join_pieces(current[:carried])) + 1 if carried else 0
+        bbox = (
+            min(p[1][0] for p in current), min(p[1][1] for p in current),
+            max(p[1][2] for p in current), max(p[1][3] for p in current)
+        )
+        chunks.append((text, bbox, overlap))
+
+    for piece in pieces:
+        if current and len(_join_pieces(current + [piece])) > chunk_size:
+            emit()
+            # Carry trailing pieces (up to chunk_overlap characters) into the next chunk
+            carry = []
+            for previous in reversed(current):
+                if len(_join_pieces([previous] + carry)) > chunk_overlap:
+                    break
+                carry.insert(0, previous)
+            current = carry
+            carried = len(carry)
+        current.append(piece)
+    if len(current) > carried:
+        emit()
+    return chunks
+
+def _nearest_region(caption_bbox, regions, max_gap=150):
+    """
+    The figure/table region a caption belongs to: the horizontally overlapping region
+    with the smallest vertical gap (captions sit just above or below their figure).
+    """
+    cx0, cy0, cx1, cy1 = caption_bbox
+    best = None
+    best_gap = max_gap
+    for region in regions:
+        rx0, ry0, rx1, ry1 = region
+        if rx1 < cx0 or rx0 > cx1:
+            continue
+        gap = max(cy0 - ry1, ry0 - cy1, 0)
+        if gap <= best_gap:
+            best = region
+            best_gap = gap
+    return best
+
+def find_figure_regions(page, min_size=FIGURE_MIN_SIZE, padding=FIGURE_PADDING):
+    """
+    Figure regions on a page: embedded image bounding boxes plus clusters of vector
+    drawings (charts, diagrams), padded and merged where they overlap.
+    Returns [(x0, y0, x1, y1)] in PDF points, top to bottom.
+    """
+    import fitz  # pymupdf
+
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    rects = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+    try:
+        for cluster in page.cluster_drawings():
+            # Page frames / full-page backgrounds are not figures
+            if cluster.width * cluster.height < 0.9 * page_area:
+                rects.append(fitz.Rect(cluster))
+    except AttributeError:
+        pass  # PyMuPDF < 1.24 has no cluster_drawings; image boxes only
+
+    regions = []
+    for rect in rects:
+        if rect.width < min_size or rect.height < min_size:
+            continue
+        rect = (rect + (-padding, -padding, padding, padding)) & page_rect
+        # Absorb any region this one overlaps, until nothing changes
+        merged = True
+        while merged:
+            merged = False
+            for other in regions:
+                if rect.intersects(other):
+                    rect |= other
+                    regions.remove(other)
+                    merged = True
+                    break
+        regions.append(rect)
+
+    regions.sort(key=lambda r: (r.y0, r.x0))
+    return [(r.x0, r.y0, r.x1, r.y1) for r in regions]
+
+def find_page_labels(page, blocks=None, regions=None):
+    """
+    Figure/Table/Chart labels on a page for the label index (src/label_index.py).
+    Text blocks that start with a label are captions and get linked to the nearest
+    figure region; other mentions are recorded as plain references.
+    Returns [(label, is_caption, caption_bbox, region_bbox)].
+    """
+    if blocks is None:
+        blocks = page.get_text("blocks", sort=True)
+    if regions is None:
+        regions = find_figure_regions(page)
+
+    entries = {}
+    for x0, y0, x1, y1, text, _, block_type in blocks:
+        if block_type != 0:
+            continue
+        label = caption_label(text)
+        if label and label not in entries:
+            bbox = (x0, y0, x1, y1)
+            entries[label] = (label, True, bbox, _nearest_region(bbox, regions))
+    for x0, y0, x1, y1, text, _, block_type in blocks:
+        if block_type == 0:
+            for label in find_labels(text):
+                entries.setdefault(label, (label, False, (x0, y0, x1, y1), None))
+    return list(entries.values())
+
+@tracing.traced("ingest.fast")
+def process_and_index_pdf(pdf_path, vectorstore, registry=None, indexes=None, max_workers=RENDER_WORKERS, batch_size=INDEX_BATCH_SIZE, prerender=PRERENDER_PAGES,
+                          on_progress=None, should_cancel=None):
+    """
+    FAST MODE: Extracts Raw Text (PyMuPDF) -> Vector Store.
+    Bypasses Gemini Vision for Speed.
+
+    Documents only store the source PDF path and page number; the page image is
+    rendered on first use by the prompt builder / UI (see src/page_cache.py), so
+    ingest cost depends on text size rather than page count x pixels.
+
+    prerender=True (PRERENDER_PAGES in src/config.py) warms the page cache during ingestion. Rendering then runs in
+    a process pool while the main thread extracts text, with at most
+    2 * max_workers renders in flight so memory stays bounded.
+
+    Each page is split into overlapping, layout-ordered chunks (see chunk_page) that
+    all keep the page link; retrieval collapses hits back to pages (src/retrieval.py).
+    Figure regions (see find_figure_regions) go into the asset table and captions into
+    the label index (see find_page_labels); crops are rendered only when a question
+    needs them.
+
+    Ingestion is incremental (see src/registry.py): an unchanged file indexed with
+    the current settings (ingest_signature) is skipped outright, and otherwise only
+    pages whose text changed are re-embedded (and re-tokenized into the BM25 index).
+
+    Background jobs (see src/job_queue.py) pass on_progress(pages_done, total_pages),
+    which replaces the Streamlit progress bar and messages, and should_cancel(), which
+    is checked between pages: pages already processed are written first, then
+    JobCancelled is raised, so a resumed job skips them.
+    Returns the number of pages written to the vector store.
+    """
     print(f"Processing Visuals (Fast Mode) for: {pdf_path}")
-    st.info("Switching to Fast Visual Indexing (Text-Based Linking)...")
-    
+    if on_progress is None:
+        def notify(kind, message):
+            getattr(st, kind)(message)
+    else:
+        def notify(kind, message):
+            print(message)
+    notify("info", "Switching to Fast Visual Indexing (Text-Based Linking)...")
+
+    if registry is None or indexes is None:
+        from src.resources import get_registry, get_indexes
+        registry = registry or get_registry()
+        indexes = indexes or get_indexes()
+
+    doc_id = document_id(pdf_path)
+    file_hash = file_fingerprint(pdf_path)
+    signature = ingest_signature("fast", CHUNK_SIZE, CHUNK_OVERLAP)
+    known = registry.get_document(doc_id)
+    if (known and not known["partial"] and known["file_hash"] == file_hash and known["mode"] == "fast"
+            and known["signature"] == signature):
+        notify("info", "Document unchanged since last ingestion. Nothing to index.")
+        return 0
+    known_pages = registry.page_hashes(doc_id)
+
     # Force usage of PyMuPDF (Fitz)
     try:
         import fitz  # pymupdf
         doc = fitz.open(pdf_path)
     except ImportError:
-        st.error("PyMuPDF (fitz) is required but missing.")
+        notify("error", "PyMuPDF (fitz) is required but missing.")
         raise RuntimeError("Please install pymupdf: pip install pymupdf")
 
-    documents_to_index = []
-    
-    progress_bar = st.progress(0, text="Starting fast analysis...")
     total_pages = len(doc)
+    if on_progress is None:
+        progress_bar = st.progress(0, text="Starting fast analysis...")
+        def on_progress(pages_done, total_pages):
+            progress_bar.progress(pages_done / total_pages, text=f"Indexing Page {pages_done} of {total_pages}...")
+    max_workers = max(1, min(max_workers, total_pages))
 
-    for i, page in enumerate(doc):
-        page_num = i + 1
-        progress_bar.progress((i + 1) / total_pages, text=f"Indexing Page {page_num} of {total_pages}...")
-        
-        # 1. Save Image Locally (High Res)
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-        image_filename = f"page_{page_num}_{os.path.basename(pdf_path)}.png"
-        image_path = os.path.join(ASSETS_DIR, image_filename)
-        pix.save(image_path)
-        
-        # 2. Extract Text instantly
-        text_content = page.get_text()
-        
-        # Fallback if page is strictly image-only (no text layer)
-        if not text_content.strip():
-            text_content = f"Page {page_num} (Visual Content Only). See image for details."
-
-        # 3. Create Document linked to Image
-        doc_obj = Document(
-            page_content=text_content, 
-            metadata={
-                "source": pdf_path, 
-                "page": page_num, 
-                "image_path": image_path 
-            }
+    # A single worker gains nothing over rendering inline and costs a process spawn
+    executor = ProcessPoolExecutor(max_workers=max_workers) if prerender and max_workers > 1 else None
+    window = 2 * max_workers
+
+    pending = deque()  # (page_num, chunks, page_info, render_future_or_None) in page order
+    batch = []  # (page_num, page_hash, [Documents], page_info) for sync_pages
+    indexed = 0
+    skipped = 0
+
+    def flush():
+        nonlocal indexed
+        if batch:
+            if not indexed:
+                # Listed (and clearable) from the first written pages on, even if the job never finishes
+                registry.record_document(doc_id, pdf_path, file_hash, total_pages, "fast", signature, partial=True)
+            with tracing.span("ingest.sync_pages", pages=len(batch)):
+                indexed += sync_pages(vectorstore, registry, doc_id, batch, indexes)
+            batch.clear()
+
+    def drain_one():
+        nonlocal skipped
+        page_num, chunks, page_info, render = pending.popleft()
+        if render is not None:
+            with tracing.span("ingest.render_wait"):
+                page_cache.register(render.result())
+
+        on_progress(page_num, total_pages)
+
+        page_hash = page_fingerprint(
+            "fast", CHUNK_SIZE, CHUNK_OVERLAP, page_info["labels"], page_info["regions"], *[c[0] for c in chunks]
         )
-        documents_to_index.append(doc_obj)
+        previous = known_pages.get(page_num)
+        if previous and previous[0] == page_hash:
+            skipped += 1
+            return
+
+        # Create Documents linked to their page (image rendered lazily)
+        page_docs = []
+        for index, (text_content, bbox, overlap) in enumerate(chunks):
+            metadata = {
+                "source": pdf_path,
+                "page": page_num,
+                "chunk": index,
+                "overlap": overlap
+            }
+            if bbox:
+                metadata["bbox"] = ",".join(f"{v:.1f}" for v in bbox)
+            page_docs.append(Document(page_content=text_content, metadata=metadata))
+        batch.append((page_num, page_hash, page_docs, page_info))
+        if len(batch) >= batch_size:
+            flush()
+
+    try:
+        for i, page in enumerate(doc):
+            page_num = i + 1
+            if should_cancel is not None and should_cancel():
+                while pending:
+                    drain_one()
+                flush()
+                if indexes.lexical is not None:
+                    indexes.lexical.save()
+                raise JobCancelled(f"Cancelled at page {page_num} of {total_pages}")
 
-    st.success(f"Successfully processed {len(documents_to_index)} pages instantly.")
+            render = None
+            if executor:
+                image_path = page_cache.cache_path(pdf_path, page_num, RENDER_ZOOM)
+                if not os.path.exists(image_path):
+                    render = executor.submit(page_cache.render_to_cache, pdf_path, page_num, image_path, RENDER_ZOOM)
+            elif prerender:
+                page_cache.get_page_image(pdf_path, page_num, RENDER_ZOOM)
+
+            # Extract and chunk Text instantly (overlaps with any render above)
+            with tracing.span("ingest.text_extract"):
+                blocks = page.get_text("blocks", sort=True)
+                chunks = chunk_page(page, blocks=blocks)
+            with tracing.span("ingest.layout"):
+                regions = find_figure_regions(page)
+                labels = find_page_labels(page, blocks, regions)
+
+            # Fallback if page is strictly image-only (no text layer)
+            if not chunks:
+                chunks = [(f"Page {page_num} (Visual Content Only). See image for details.", None, 0)]
+
+            pending.append((page_num, chunks, {"labels": labels, "regions": regions}, render))
+            while len(pending) >= window:
+                drain_one()
+
+        while pending:
+            drain_one()
+        flush()
+        finalize_document(vectorstore, registry, doc_id, pdf_path, file_hash, total_pages, mode="fast", indexes=indexes,
+                          signature=signature)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        doc.close()
+
+    if skipped:
+        notify("info", f"Skipped {skipped} unchanged pages.")
 
     # Index the DOCUMENTS
-    if documents_to_index:
-        st.info(f"Indexing {len(documents_to_index)} pages into Knowledge Base...")
-        vectorstore.add_documents(documents_to_index)
-        st.success("Indexing Complete! You can now ask questions.")
-        return len(documents_to_index)
+    if indexed:
+        notify("success", f"Indexing Complete! Indexed {indexed} pages. You can now ask questions.")
+        return indexed
+    elif skipped:
+        notify("success", "Knowledge Base already up to date.")
+        return 0
     else:
-        st.warning("No content found to index.")
+        notify("warning", "No content found to index.")
         return 0
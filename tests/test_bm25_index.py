@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+
+from src.bm25_index import BM25Index, tokenize
+
+
+def exhaustive_scores(index, query):
+    """
+    Plain Okapi BM25 over every document, no pruning.
+    """
+    n_docs = len(index.doc_lengths)
+    avg_length = index.total_length / n_docs or 1.0
+    scores = {}
+    for term in set(tokenize(query)):
+        docs = index.postings.get(term, {})
+        if not docs:
+            continue
+        idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc_id, tf in docs.items():
+            norm = index.k1 * (1 - index.b + index.b * index.doc_lengths[doc_id] / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (index.k1 + 1) / (tf + norm)
+    return scores
+
+
+def random_corpus(rng, n_docs=2000, vocabulary=3000):
+    # Zipf-like term frequencies, so queries mix rare and very common terms
+    words = [f"w{i}" for i in range(vocabulary)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary)]
+    return {f"doc{i}": " ".join(rng.choices(words, weights, k=rng.randint(5, 120))) for i in range(n_docs)}, words, weights
+
+
+def test_pruned_search_matches_exhaustive_scoring():
+    rng = random.Random(7)
+    corpus, words, weights = random_corpus(rng)
+    index = BM25Index()
+    index.add_many(list(corpus), list(corpus.values()))
+
+    for _ in range(300):
+        query = " ".join(rng.choices(words, weights, k=rng.randint(1, 8)))
+        k = rng.choice([1, 5, 10, 30])
+        results = index.search(query, k=k)
+        expected = sorted(exhaustive_scores(index, query).items(), key=lambda item: item[1], reverse=True)[:k]
+
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+        # Same documents, apart from ties at the k-th score
+        if len(expected) == k:
+            cutoff = expected[-1][1] + 1e-9
+            assert {d for d, s in results if s > cutoff} == {d for d, s in expected if s > cutoff}
+        else:
+            assert {d for d, _ in results} == {d for d, _ in expected}
+
+
+def test_search_stays_exact_after_removals():
+    rng = random.Random(11)
+    corpus, words, weights = random_corpus(rng, n_docs=500)
+    index = BM25Index()
+    index.add_many(list(corpus), list(corpus.values()))
+    index.search("w1 w2", k=5)  # Builds the cached norms and term bounds
+    index.remove_many(list(corpus)[:200])
+
+    for _ in range(50):
+        query = " ".join(rng.choices(words, weights, k=3))
+        expected = sorted(exhaustive_scores(index, query).values(), reverse=True)[:10]
+        assert [score for _, score in index.search(query, k=10)] == pytest.approx(expected)
+
+
+def test_documents_without_tokens():
+    index = BM25Index()
+    index.add_many(["a", "b"], ["", "!!! ---"])
+    assert index.search("anything", k=5) == []
+
+    index.add("c", "figure 3 shows the results")
+    assert [doc_id for doc_id, _ in index.search("Figure 3", k=5)] == ["c"]
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "bm25.pkl"
+    index = BM25Index(str(path))
+    index.add_many(["a", "b"], ["table 1 inventory", "figure 2 blue box"])
+    index.save()
+
+    loaded = BM25Index.load(str(path))
+    assert len(loaded) == 2
+    assert loaded.search("blue box", k=1)[0][0] == "b"
@@ -0,0 +1,166 @@
+import base64
+import threading
+import time
+
+import pytest
+
+from src import llm_utils, tracing
+from src.rate_limiter import RateLimiter
+from src.vision_describer import describe_pages
+
+
+class FakeClock:
+    """
+    Clock + sleep pair for RateLimiter: sleeping advances the clock instantly.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class RateLimited(Exception):
+    pass
+
+
+class StubLLM:
+    """
+    Vision LLM stand-in: answers from the image bytes, optionally failing the first
+    calls of some pages, and records how many calls run at once.
+    """
+    model = "stub-vision"
+
+    def __init__(self, failures=None, delay=0.01):
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        image_url = messages[0].content[1]["image_url"]["url"]
+        with self._lock:
+            self.calls.append(image_url)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            with self._lock:
+                if self.failures.get(image_url, 0) > 0:
+                    self.failures[image_url] -= 1
+                    raise RateLimited("429")
+            return Response(f"description of {image_url[-8:]}")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def image_url(image_bytes):
+    # How build_vision_message inlines a page image
+    return "data:image/png;base64," + base64.b64encode(image_bytes).decode()
+
+
+def unlimited():
+    return RateLimiter(10 ** 9, 10 ** 12)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_utils, "backoff_seconds", lambda attempt: 0.01)
+
+
+def test_rate_limiter_spaces_requests_after_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(60, clock=clock, sleep=clock.sleep)
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.sleeps == []  # A full bucket is one minute's worth
+
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.now == pytest.approx(5.0)  # Then one request per second
+
+
+def test_rate_limiter_token_budget():
+    clock = FakeClock()
+    limiter = RateLimiter(1000, tokens_per_minute=6000, clock=clock, sleep=clock.sleep)
+    limiter.acquire(6000)
+    limiter.acquire(3000)
+    assert clock.now == pytest.approx(30.0)
+    limiter.acquire(10 ** 6)  # Larger than the bucket: waits for a full bucket, then goes
+    assert clock.now == pytest.approx(90.0)
+
+
+def test_describe_pages_returns_every_page():
+    llm = StubLLM()
+    pages = [(n, f"page-{n}".encode()) for n in range(1, 13)]
+    finished = []
+
+    results = describe_pages(pages, llm, max_concurrency=4, limiter=unlimited(),
+                             on_result=lambda page, text: finished.append(page))
+
+    assert sorted(results) == list(range(1, 13))
+    assert sorted(finished) == list(range(1, 13))
+    assert 1 < llm.max_active <= 4
+
+
+def test_describe_pages_retries_rate_limited_pages():
+    pages = [(n, f"page-{n}".encode()) for n in range(1, 6)]
+    page_2_url = image_url(b"page-2")
+    llm = StubLLM(failures={page_2_url: 2})  # Page 2 is rate limited twice, then succeeds
+
+    results = describe_pages(pages, llm, max_concurrency=2, limiter=unlimited(), retryable=(RateLimited,))
+
+    assert sorted(results) == [1, 2, 3, 4, 5]
+    assert results[2].startswith("description of")
+    assert llm.calls.count(page_2_url) == 3
+
+
+def test_describe_pages_gives_up_after_max_attempts():
+    pages = [(1, b"page-1"), (2, b"page-2")]
+    url = image_url(b"page-1")
+    llm = StubLLM(failures={url: 100})
+
+    results = describe_pages(pages, llm, max_concurrency=2, limiter=unlimited(),
+                             retryable=(RateLimited,), max_attempts=3)
+
+    assert results[1] == "Visual description unavailable for page 1."
+    assert results[2].startswith("description of")
+    assert llm.calls.count(url) == 3
+
+
+def test_describe_pages_holds_at_most_max_concurrency_pages():
+    held = set()
+    peak = [0]
+
+    def pages():
+        for n in range(1, 10):
+            held.add(n)
+            peak[0] = max(peak[0], len(held))
+            yield n, f"page-{n}".encode()
+
+    llm = StubLLM(failures={image_url(f"page-{n}".encode()): 1 for n in range(1, 10)})  # Every page 429s once
+    describe_pages(pages(), llm, max_concurrency=3, limiter=unlimited(), retryable=(RateLimited,),
+                   on_result=lambda page, text: held.discard(page))
+
+    assert peak[0] <= 3
+
+
+def test_describe_pages_spans_join_callers_trace():
+    with tracing.trace("ingest.vision") as vision_trace:
+        describe_pages([(1, b"page-1")], StubLLM(), limiter=unlimited())
+    names = [span["name"] for span in vision_trace.spans]
+    assert "vision.llm" in names and "vision.rate_limit_wait" in names
@@ -0,0 +1,441 @@
+"""
+Ingestion and query benchmarks over the PDFs in data/input.
+
+    python tools/benchmark.py                        # all modes, all PDFs
+    python tools/benchmark.py --modes fast,query --limit 3
+    python tools/benchmark.py --compare data/benchmarks/<previous>.json
+
+Each mode runs in a fresh subprocess with RAG_DATA_DIR pointing at a temporary
+directory, so caches start cold, runs don't touch the real knowledge base and
+peak RSS is per mode. Results are written as JSON (default data/benchmarks/)
+keyed by the current git commit so runs can be compared across commits.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT_DIR)
+
+DEFAULT_INPUT_DIR = os.path.join(ROOT_DIR, "data", "input")
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, "data", "benchmarks")
+MODES = ("fast", "vision", "extractor", "query")
+COLLECTION = "benchmark"
+
+DEFAULT_QUERIES = [
+    "What is shown in Figure 1?",
+    "Describe Table 1",
+    "Summarize the main results",
+    "What method is proposed?",
+    "What are the limitations?",
+    "How was the experiment evaluated?",
+]
+
+
+# ---------------------------------------------------------------- measurement
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def dir_bytes(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TimedModel:
+    """
+    Wraps the embedding model behind CachedEmbeddings to time actual model calls.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.seconds = 0.0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        start = time.perf_counter()
+        vectors = self.model.embed_documents(texts)
+        self.seconds += time.perf_counter() - start
+        self.texts += len(texts)
+        return vectors
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        vector = self.model.embed_query(text)
+        self.seconds += time.perf_counter() - start
+        self.texts += 1
+        return vector
+
+
+class StubVisionLLM:
+    """
+    Stand-in for Gemini: fixed description after an optional simulated latency.
+    """
+    model = "benchmark-stub"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        class Response:
+            content = f"Stub description {self.calls}: Figure 1 shows a chart. Table 1 lists results."
+        return Response()
+
+
+def timed_embeddings():
+    from src.resources import get_embeddings
+    start = time.perf_counter()
+    embeddings = get_embeddings()
+    load_seconds = time.perf_counter() - start
+    timer = TimedModel(embeddings.model)
+    embeddings.model = timer
+    return timer, load_seconds
+
+
+def page_total(pdf_paths):
+    import fitz  # pymupdf
+    total = 0
+    for path in pdf_paths:
+        with fitz.open(path) as doc:
+            total += len(doc)
+    return total
+
+
+# ---------------------------------------------------------------- modes (run in the child)
+
+def _ingest_fast(pdf_paths):
+    from src.resources import get_vectorstore, get_registry, get_indexes
+    from src.visual_processor import process_and_index_pdf
+    vectorstore = get_vectorstore(COLLECTION)
+    registry = get_registry(COLLECTION)
+    indexes = get_indexes(COLLECTION)
+    written = 0
+    for path in pdf_paths:
+        written += process_and_index_pdf(
+            path, vectorstore, registry, indexes, on_progress=lambda done, total: None
+        )
+    return written
+
+
+def run_fast(pdf_paths, args):
+    from src.config import ASSETS_DIR
+    timer, load_seconds = timed_embeddings()
+    start = time.perf_counter()
+    written = _ingest_fast(pdf_paths)
+    seconds = time.perf_counter() - start
+    pages = page_total(pdf_paths)
+    return {
+        "pages": pages,
+        "pages_indexed": written,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+        "embedding_model_load_seconds": round(load_seconds, 3),
+        "embedding_seconds": round(timer.seconds, 3),
+        "embedded_texts": timer.texts,
+        "assets_bytes": dir_bytes(ASSETS_DIR),
+    }
+
+
+def run_vision(pdf_paths, args):
+    from src.config import ASSETS_DIR
+    from src.rate_limiter import RateLimiter
+    from src.vision_indexer import process_pdf_with_vision
+    from src.vectorstore import get_retriever
+    timer, load_seconds = timed_embeddings()
+    llm = StubVisionLLM(args.stub_latency)
+    # The stub has no quota; only concurrency bounds the run
+    limiter = RateLimiter(10 ** 9, 10 ** 12)
+
+    start = time.perf_counter()
+    describe_seconds = 0.0
+    documents = 0
+    for path in pdf_paths:
+        step = time.perf_counter()
+        docs = process_pdf_with_vision(path, ASSETS_DIR, llm=llm, limiter=limiter)
+        describe_seconds += time.perf_counter() - step
+        documents += len(docs)
+        get_retriever(documents=docs, collection_name=COLLECTION)
+    seconds = time.perf_counter() - start
+    pages = page_total(pdf_paths)
+    return {
+        "pages": pages,
+        "documents": documents,
+        "llm_calls": llm.calls,
+        "stub_latency": args.stub_latency,
+        "seconds": round(seconds, 3),
+        "render_and_describe_seconds": round(describe_seconds, 3),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+        "embedding_model_load_seconds": round(load_seconds, 3),
+        "embedding_seconds": round(timer.seconds, 3),
+        "embedded_texts": timer.texts,
+        "assets_bytes": dir_bytes(ASSETS_DIR),
+    }
+
+
+def run_extractor(pdf_paths, args):
+    from src.config import ASSETS_DIR
+    try:
+        from src.extractor import PDFExtractor
+    except ImportError as e:
+        return {"skipped": f"extractor unavailable: {e}"}
+    from src.vectorstore import get_retriever
+    timer, load_seconds = timed_embeddings()
+    extractor = PDFExtractor()
+
+    start = time.perf_counter()
+    extract_seconds = 0.0
+    items = 0
+    for path in pdf_paths:
+        step = time.perf_counter()
+        data = extractor.extract(path)
+        extract_seconds += time.perf_counter() - step
+        items += len(data)
+        get_retriever(extracted_data=data, collection_name=COLLECTION)
+    seconds = time.perf_counter() - start
+    pages = page_total(pdf_paths)
+    return {
+        "pages": pages,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "extract_seconds": round(extract_seconds, 3),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+        "embedding_model_load_seconds": round(load_seconds, 3),
+        "embedding_seconds": round(timer.seconds, 3),
+        "embedded_texts": timer.texts,
+        "assets_bytes": dir_bytes(ASSETS_DIR),
+    }
+
+
+def _payload_bytes(messages):
+    """
+    Text characters plus inline image data of a prompt, as sent to the LLM.
+    """
+    text_bytes = 0
+    image_bytes = 0
+    images = 0
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            text_bytes += len(content.encode("utf-8"))
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                text_bytes += len(part["text"].encode("utf-8"))
+            elif part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+                image_bytes += len(url)
+                images += 1
+    return text_bytes, image_bytes, images
+
+
+def run_query(pdf_paths, args):
+    from src.chain import multimodal_prompt_builder
+    from src.retrieval import retrieve
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    _ingest_fast(pdf_paths)
+    timer, _ = timed_embeddings()
+
+    latencies = []
+    cold_latencies = []
+    prompt_seconds = []
+    text_sizes = []
+    image_sizes = []
+    image_counts = []
+    for round_index in range(args.rounds):
+        for question in queries:
+            start = time.perf_counter()
+            docs = retrieve(question, collection_name=COLLECTION)
+            elapsed = time.perf_counter() - start
+            (cold_latencies if round_index == 0 else latencies).append(elapsed)
+
+            start = time.perf_counter()
+            messages = multimodal_prompt_builder({"context": docs, "question": question, "collection_name": COLLECTION})
+            prompt_seconds.append(time.perf_counter() - start)
+            text_bytes, image_bytes, images = _payload_bytes(messages)
+            text_sizes.append(text_bytes)
+            image_sizes.append(image_bytes)
+            image_counts.append(images)
+
+    latencies = latencies or cold_latencies
+    return {
+        "queries": len(queries),
+        "rounds": args.rounds,
+        "retrieval_cold_p50_ms": round(percentile(cold_latencies, 50) * 1000, 2),
+        "retrieval_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "retrieval_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "prompt_build_p50_ms": round(percentile(prompt_seconds, 50) * 1000, 2),
+        "prompt_build_p95_ms": round(percentile(prompt_seconds, 95) * 1000, 2),
+        "query_embedding_seconds": round(timer.seconds, 3),
+        "prompt_text_bytes_p50": percentile(text_sizes, 50),
+        "prompt_text_bytes_max": max(text_sizes),
+        "prompt_image_bytes_p50": percentile(image_sizes, 50),
+        "prompt_image_bytes_max": max(image_sizes),
+        "prompt_images_max": max(image_counts),
+    }
+
+
+RUNNERS = {"fast": run_fast, "vision": run_vision, "extractor": run_extractor, "query": run_query}
+
+
+def run_child(args):
+    pdf_paths = json.loads(args.files)
+    try:
+        result = RUNNERS[args.run_mode](pdf_paths, args)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result["peak_rss_mb"] = peak_rss_mb()
+    # Last stdout line is the result; everything before it is the pipeline's own logging
+    print("BENCHMARK_RESULT " + json.dumps(result))
+
+
+# ---------------------------------------------------------------- driver (parent)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_mode(mode, pdf_paths, args):
+    with tempfile.TemporaryDirectory(prefix=f"rag_bench_{mode}_") as data_dir:
+        env = dict(os.environ, RAG_DATA_DIR=data_dir)
+        command = [
+            sys.executable, os.path.abspath(__file__), "--run-mode", mode,
+            "--files", json.dumps(pdf_paths), "--rounds", str(args.rounds),
+            "--stub-latency", str(args.stub_latency)
+        ]
+        if args.queries:
+            command += ["--queries", os.path.abspath(args.queries)]
+        start = time.perf_counter()
+        process = subprocess.run(command, env=env, capture_output=True, text=True, cwd=ROOT_DIR)
+        wall = time.perf_counter() - start
+
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith("BENCHMARK_RESULT "):
+            result = json.loads(line[len("BENCHMARK_RESULT "):])
+            break
+    else:
+        result = {"error": f"exit code {process.returncode}", "stderr": process.stderr[-2000:]}
+    result["wall_seconds"] = round(wall, 3)
+    if args.verbose:
+        print(process.stdout)
+        print(process.stderr, file=sys.stderr)
+    return result
+
+
+def compare(current, previous_path):
+    """
+    Prints numeric metrics that changed between a previous results file and this run.
+    """
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous.get('commit')} ({previous_path}):")
+    for mode, metrics in current["results"].items():
+        before = previous.get("results", {}).get(mode, {})
+        for name, value in metrics.items():
+            old = before.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == value:
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "new"
+            print(f"  {mode}.{name}: {old} -> {value} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated subset of: " + ", ".join(MODES))
+    parser.add_argument("--input-dir", default=DEFAULT_INPUT_DIR)
+    parser.add_argument("--limit", type=int, default=0, help="Only the first N PDFs (0 = all)")
+    parser.add_argument("--rounds", type=int, default=5, help="Query rounds (first one is reported as cold)")
+    parser.add_argument("--queries", help="File with one question per line")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Simulated vision LLM latency (seconds)")
+    parser.add_argument("--output", help="Results file (default data/benchmarks/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Previous results file to diff against")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--files", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_child(args)
+        return
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.input_dir, "*.pdf")))
+    if args.limit:
+        pdf_paths = pdf_paths[:args.limit]
+    if not pdf_paths:
+        print(f"No PDFs found in {args.input_dir}")
+        sys.exit(1)
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "files": [os.path.basename(p) for p in pdf_paths],
+        "results": {},
+    }
+    for mode in modes:
+        print(f"Running {mode} benchmark over {len(pdf_paths)} PDFs...")
+        result = run_mode(mode, pdf_paths, args)
+        report["results"][mode] = result
+        print(json.dumps(result, indent=2))
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
+        output = os.path.join(DEFAULT_OUTPUT_DIR, f"{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Cold-start profile: how long importing each entry point takes in a fresh
+interpreter, and which imports dominate (python -X importtime).
+
+    python tools/profile_startup.py                 # default targets
+    python tools/profile_startup.py src.chain app.py --top 15
+    python tools/profile_startup.py --json startup.json
+
+A target is a module name (imported) or a .py script (executed, e.g. app.py in
+Streamlit "bare" mode, which approximates the time to the first paint).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_TARGETS = [
+    "src.config",
+    "src.page_renderer",     # Render worker processes
+    "src.job_queue",
+    "src.resources",
+    "src.visual_processor",
+    "src.chain",
+    "src.vision_indexer",
+    "app.py",
+]
+
+_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{action}
+print("STARTUP_SECONDS", time.perf_counter() - start, flush=True)
+"""
+
+
+def _action(target):
+    if target.endswith(".py"):
+        path = os.path.join(ROOT_DIR, target)
+        return f"import runpy; runpy.run_path({path!r}, run_name='__main__')"
+    return f"import {target}"
+
+
+def parse_importtime(stderr):
+    """
+    [(module, cumulative_us, depth)] from -X importtime output.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2][1:]  # One separator space, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(parts[1].strip()), depth))
+    return rows
+
+
+def profile(target, top):
+    code = _SNIPPET.format(root=ROOT_DIR, action=_action(target))
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=ROOT_DIR
+    )
+    seconds = None
+    for line in process.stdout.splitlines():
+        if line.startswith("STARTUP_SECONDS"):
+            seconds = float(line.split()[1])
+    rows = parse_importtime(process.stderr)
+    # Direct imports of the target and their children one level down are the actionable ones
+    heaviest = sorted((r for r in rows if r[2] <= 2), key=lambda r: r[1], reverse=True)[:top]
+    result = {
+        "target": target,
+        "seconds": round(seconds, 3) if seconds is not None else None,
+        "modules_imported": len(rows),
+        "heaviest": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us, _ in heaviest],
+    }
+    if seconds is None:
+        errors = [l for l in process.stderr.splitlines() if not l.startswith("import time:")]
+        result["error"] = "\n".join(errors[-5:])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--top", type=int, default=8, help="Heaviest imports listed per target")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = []
+    for target in args.targets:
+        result = profile(target, args.top)
+        report.append(result)
+        seconds = f"{result['seconds']:.3f} s" if result["seconds"] is not None else "FAILED"
+        print(f"{target}: {seconds} ({result['modules_imported']} modules)")
+        for entry in result["heaviest"]:
+            print(f"    {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+        if "error" in result:
+            print(f"    {result['error']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
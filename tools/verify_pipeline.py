@@ -8,7 +8,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 try:
     from src.extractor import PDFExtractor
     from src.vectorstore import get_retriever
-    from src.graph import app as graph_app
+    from src.chain import get_chain
 except ImportError as e:
     print(f"Import Error: {e}")
     sys.exit(1)
@@ -42,16 +42,15 @@ def test_pipeline():
         traceback.print_exc()
         return
     
-    print("\n3. Testing Agent Query (Table)...")
+    print("\n3. Testing RAG Query (Table)...")
     try:
-        state = {"question": "How many Widget B do we have?", "retry_count": 0}
-        result = graph_app.invoke(state)
-        print(f"Q: How many Widget B do we have?\nA: {result['answer']}")
+        chain = get_chain()
+        result = chain.invoke("How many Widget B do we have?")
+        print(f"Q: How many Widget B do we have?\nA: {result.answer}")
 
-        print("\n4. Testing Agent Query (Image)...")
-        state = {"question": "What is shown in Figure 1?", "retry_count": 0}
-        result = graph_app.invoke(state)
-        print(f"Q: What is shown in Figure 1?\nA: {result['answer']}")
+        print("\n4. Testing RAG Query (Image)...")
+        result = chain.invoke("What is shown in Figure 1?")
+        print(f"Q: What is shown in Figure 1?\nA: {result.answer}")
     except Exception:
         traceback.print_exc()
 